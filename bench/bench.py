@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+import click
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from itertools import islice, product
+from pathlib import Path
+
+import bench.fakes as fakes
+
+pool = "bench"
+
+# The fake programs need no root, so neither does strapper run against them; only the
+# benchmarks' own process pretends to be root, never the installed command.
+runner = "; ".join(
+    (
+        "import os, sys",
+        "os.geteuid = lambda: 0",
+        "from addict import Dict",
+        "from strapper.strapper import strapper",
+        "strapper(sys.argv[1:], obj=Dict())",
+    )
+)
+
+commands = {
+    "create": lambda jobs: (
+        ("create", "-z", "/dev/fake", "-j", str(jobs)),
+        "ZFS CREATE\n",
+    ),
+    "update": lambda jobs: (("update", "-p", "-j", str(jobs)), ""),
+    "mount": lambda jobs: (("mount", "-b", "/dev/fake-boot"), ""),
+}
+
+
+def synthetic_tree(nodes, branching=8):
+    # A breadth-first tree of `nodes' datasets under a single top-level dataset.
+    tree = dict()
+    frontier = [tree]
+    names = iter(range(nodes))
+    while frontier:
+        level = []
+        for parent in frontier:
+            if not (children := {f"d{i}": dict() for i in islice(names, branching)}):
+                break
+            parent["datasets"] = children
+            level.extend(children.values())
+        frontier = level
+    return tree
+
+
+def write_resources(directory, nodes, users):
+    directory.mkdir(parents=True, exist_ok=True)
+    datasets = dict(
+        system=dict(
+            datasets=dict(home=dict(), persist=dict(), root=dict(), nix=dict()),
+            options=["mountpoint=legacy"],
+        ),
+        virt=dict(datasets=dict(podman=dict()), options=["mountpoint=legacy"]),
+        synthetic=synthetic_tree(nodes),
+    )
+    names = {f"user{i}": f"user{i}" for i in range(users)}
+    (directory / "datasets.yaml").write_text(json.dumps(datasets))
+    (directory / "user_datasets.yaml").write_text(
+        json.dumps(
+            dict(user0=dict(datasets=dict(user=dict()), options=["mountpoint=legacy"]))
+        )
+    )
+    (directory / "username.txt").write_text("user0")
+    (directory / "users.json").write_text(json.dumps(names))
+    (directory / "homes.json").write_text(
+        json.dumps({key: "/home/" + name for [key, name] in names.items()})
+    )
+
+
+def run(command, nodes, users, latency=0.0, jobs=4):
+    with tempfile.TemporaryDirectory(prefix="strapper-bench-") as directory:
+        directory = Path(directory)
+        state = directory / "state"
+        state.mkdir()
+        if command != "create":
+            (state / "datasets.json").write_text(json.dumps({pool: dict()}))
+        write_resources(directory / "resources", nodes, users)
+        (nixos := directory / "etc" / "nixos").mkdir(parents=True)
+        bin = fakes.install(directory / "bin")
+        # `mount' mounts into, and reads what is mounted from, the directory instead.
+        (system := directory / "root").mkdir()
+        (mountinfo := directory / "mountinfo").touch()
+        environment = os.environ | dict(
+            PATH=f"{bin}{os.pathsep}{os.environ.get('PATH', '')}",
+            PYTHONPATH=os.pathsep.join(
+                filter(
+                    None,
+                    (
+                        str(Path(__file__).parent.parent),
+                        os.environ.get("PYTHONPATH"),
+                    ),
+                )
+            ),
+            STRAPPER_FAKE_STATE=str(state),
+            STRAPPER_FAKE_LATENCY=str(latency),
+            STRAPPER_MOUNTINFO=str(mountinfo),
+            STRAPPER_SYSTEM_ROOT=str(system),
+            STRAPPER_RESOURCES=str(directory / "resources"),
+            XDG_CACHE_HOME=str(directory / "cache"),
+        )
+        [args, stdin] = commands[command](jobs)
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            (sys.executable, "-c", runner, "-H", pool, "-r", str(nixos), *args),
+            env=environment,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        process.stdin.write(stdin)
+        process.stdin.close()
+        stderr = process.stderr.read()
+        # Reaping the process ourselves gives its own peak resident set size.
+        [_, status, usage] = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        calls = (state / "calls.log").read_text().splitlines()
+        return dict(
+            command=command,
+            nodes=nodes,
+            users=users,
+            wall=wall,
+            subprocesses=len(calls),
+            rss=usage.ru_maxrss,
+            status=process.returncode,
+            error=stderr.strip().splitlines()[-1:] if process.returncode else [],
+        )
+
+
+@click.command()
+@click.option(
+    "-c",
+    "--command",
+    "selected",
+    multiple=True,
+    type=click.Choice(tuple(commands)),
+    default=("update", "create"),
+    show_default=True,
+)
+@click.option(
+    "-n", "--nodes", multiple=True, type=int, default=(10, 100, 1000), show_default=True
+)
+@click.option(
+    "-u", "--users", multiple=True, type=int, default=(1, 50), show_default=True
+)
+@click.option(
+    "-l",
+    "--latency",
+    type=float,
+    default=0.0,
+    show_default=True,
+    help="Seconds each fake program sleeps for",
+)
+@click.option("-j", "--jobs", type=int, default=4, show_default=True)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False),
+    help="Also write the results as JSON",
+)
+def bench(selected, nodes, users, latency, jobs, output):
+    results = []
+    print(
+        f"{'command':<8} {'nodes':>6} {'users':>6} {'wall':>10} {'processes':>10} {'peak rss':>10}"
+    )
+    for [command, n, u] in product(selected, nodes, users):
+        result = run(command, n, u, latency=latency, jobs=jobs)
+        results.append(result)
+        print(
+            f"{command:<8} {n:>6} {u:>6} {result['wall']:>9.2f}s {result['subprocesses']:>10} {result['rss'] / 1024:>8.1f}MB",
+            *(("failed:", *result["error"]) if result["status"] else ()),
+        )
+    if output:
+        Path(output).write_text(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+import fcntl
+import json
+import os
+import sys
+import time
+
+from pathlib import Path
+
+from strapper.inventory import normalize
+
+# Stand-ins for the programs strapper runs, for the benchmarks; each keeps its state in
+# `STRAPPER_FAKE_STATE', sleeps for `STRAPPER_FAKE_LATENCY' seconds, and logs every call.
+programs = (
+    "blkdiscard",
+    "fallocate",
+    "getconf",
+    "mkfs",
+    "mkswap",
+    "mount",
+    "nix",
+    "nixos-generate-config",
+    "nixos-install",
+    "nixos-rebuild",
+    "parted",
+    "sd",
+    "swapon",
+    "udevadm",
+    "umount",
+    "wipefs",
+    "zfs",
+    "zpool",
+)
+
+# The options of each subcommand that take a value.
+valued = {
+    "create": "obVOmRt",
+    "clone": "o",
+    "list": "otdsS",
+    "get": "otds",
+    "set": "",
+    "snapshot": "o",
+    "import": "odR",
+}
+
+
+def parse(args):
+    subcommand = None
+    options = []
+    positional = []
+    args = iter(arg for arg in args if arg != "")
+    for arg in args:
+        if subcommand is None and not arg.startswith("-"):
+            subcommand = arg
+        elif arg.startswith("--"):
+            options.append((arg, None))
+        elif arg.startswith("-") and len(arg) > 1:
+            for [i, flag] in enumerate(arg[1:]):
+                if flag in valued.get(subcommand, ""):
+                    options.append((flag, arg[i + 2 :] or next(args, None)))
+                    break
+                options.append((flag, None))
+        else:
+            positional.append(arg)
+    return subcommand, dict(options), positional
+
+
+class State:
+    def __init__(self, directory):
+        self.path = Path(directory, "datasets.json")
+        try:
+            self.datasets = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            self.datasets = dict()
+
+    def save(self):
+        temporary = self.path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(self.datasets))
+        os.replace(temporary, self.path)
+
+    def add(self, name, properties=()):
+        self.datasets[name] = dict(
+            (prop, normalize(prop, value))
+            for option in properties
+            if option
+            for [prop, value] in (option.partition("=")[::2],)
+        )
+
+    def children(self, root, recursive=True):
+        for name in self.datasets:
+            if name == root or (
+                recursive
+                and (name.startswith(root + "/") or name.startswith(root + "@"))
+            ):
+                yield name
+
+
+def zfs(state, subcommand, options, positional):
+    if subcommand == "list":
+        roots = positional or [name for name in state.datasets if not "/" in name]
+        for root in roots:
+            depth = int(options.get("d") or 0) if "d" in options else None
+            for name in state.children(root, "r" in options or depth or not positional):
+                if depth is not None and name.count("/") - root.count("/") > depth:
+                    continue
+                if ("@" in name) == ("snapshot" in (options.get("t") or "")):
+                    print(name)
+    elif subcommand == "get":
+        properties = positional[0].split(",")
+        for root in positional[1:]:
+            for name in state.children(root, "r" in options):
+                values = dict(type="filesystem") | state.datasets[name]
+                for prop in values if properties == ["all"] else properties:
+                    if prop in values:
+                        print(name, prop, values[prop], sep="\t")
+    elif subcommand == "create":
+        state.add(positional[-1], (options.get("o"),))
+    elif subcommand == "clone":
+        state.add(positional[-1], (options.get("o"),))
+    elif subcommand == "snapshot":
+        for name in positional:
+            state.add(name)
+    elif subcommand == "set":
+        [prop, value] = positional[0].partition("=")[::2]
+        state.datasets.setdefault(positional[-1], dict())[prop] = normalize(prop, value)
+    elif subcommand == "destroy":
+        for name in list(state.children(positional[-1], "r" in options)):
+            del state.datasets[name]
+    else:
+        return
+    state.save()
+
+
+def zpool(state, subcommand, options, positional):
+    if subcommand == "create":
+        state.add(positional[0])
+        state.save()
+    elif subcommand == "get":
+        properties = dict(size=str(2**40), free=str(2**40), ashift="12")
+        for pool in positional[1:]:
+            for prop in (
+                properties if positional[0] == "all" else positional[0].split(",")
+            ):
+                print(pool, prop, properties.get(prop, "-"), sep="\t")
+    elif subcommand == "list":
+        pools = positional or [name for name in state.datasets if not "/" in name]
+        for pool in pools:
+            if pool in state.datasets:
+                print(pool)
+            else:
+                return 1
+
+
+def getconf(state, subcommand, options, positional):
+    if subcommand == "PAGESIZE":
+        print(4096)
+
+
+def main(program, args):
+    directory = os.environ["STRAPPER_FAKE_STATE"]
+    with open(Path(directory, "calls.log"), "a") as log:
+        log.write(json.dumps([program, *args]) + "\n")
+    time.sleep(float(os.environ.get("STRAPPER_FAKE_LATENCY", 0)))
+    if fake := {"zfs": zfs, "zpool": zpool, "getconf": getconf}.get(program):
+        # Concurrent calls take turns with the state, but not with the latency.
+        with open(Path(directory, "lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            return fake(State(directory), *parse(args)) or 0
+    return 0
+
+
+def install(directory):
+    # Write an executable for every program into `directory', to be put first on `PATH'.
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for program in programs:
+        executable = directory / program
+        executable.write_text(
+            "\n".join(
+                (
+                    "#!" + sys.executable,
+                    "import sys",
+                    "from bench.fakes import main",
+                    f"sys.exit(main({program!r}, sys.argv[1:]))",
+                    "",
+                )
+            )
+        )
+        executable.chmod(0o755)
+    return directory
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1], sys.argv[2:]))
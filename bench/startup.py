@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import subprocess
+import sys
+import time
+
+import click
+
+# `strapper --help' and argument validation should never need more than this.
+budget = 100
+
+help_script = "from strapper.strapper import strapper; strapper(['--help'])"
+
+
+def import_times(module="strapper.strapper"):
+    # (self microseconds, cumulative microseconds, module), as reported by `-X importtime'
+    output = subprocess.run(
+        (sys.executable, "-X", "importtime", "-c", "import " + module),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    times = []
+    for line in output.splitlines():
+        if line.startswith("import time:") and not line.endswith("imported package"):
+            fields = line.removeprefix("import time:").split("|")
+            times.append((int(fields[0]), int(fields[1]), fields[2].strip()))
+    return times
+
+
+def help_time(runs=5):
+    # The best of a few runs, in milliseconds, so a noisy machine doesn't fail the budget.
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            (sys.executable, "-c", help_script),
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+@click.command()
+@click.option("-b", "--budget", "limit", type=float, default=budget, show_default=True)
+@click.option("-n", "--slowest", type=int, default=10, show_default=True)
+def startup(limit, slowest):
+    times = import_times()
+    total = sum(t[0] for t in times) / 1000
+    print(f"Importing strapper.strapper: {total:.1f} ms")
+    for [self_time, cumulative, module] in sorted(times, reverse=True)[:slowest]:
+        print(f"\t{self_time / 1000:8.1f} ms\t{cumulative / 1000:8.1f} ms\t{module}")
+    help_ms = help_time()
+    print(f"strapper --help: {help_ms:.1f} ms (budget: {limit:.0f} ms)")
+    if help_ms > limit:
+        sys.exit(f"strapper --help is over its startup budget of {limit:.0f} ms!")
+
+
+if __name__ == "__main__":
+    startup()
@@ -57,14 +57,19 @@
       type = "hy";
       pname = "strapper";
       callPackage =
-        args@{ callPackage, util-linux, getconf, parted, sd, rsync }:
+        args@{ callPackage, util-linux, getconf, parted, sd, dosfstools, systemd
+        , python3Packages }:
         callPackage (iron.mkPythonPackage {
           inherit self inputs;
           recursiveOverrides = toList "postCheck";
           package = rec {
             owner = "syvlorg";
             src = ./.;
-            propagatedBuildInputs = [ util-linux getconf parted sd rsync ];
+            # `mkfs -t vfat' needs `dosfstools', and `udevadm settle' `systemd';
+            # `lz4' and `zstandard' are the codecs `tune-compression' measures.
+            propagatedBuildInputs =
+              [ util-linux getconf parted sd dosfstools systemd ]
+              ++ (with python3Packages; [ lz4 zstandard ]);
             postPatch = ''
               substituteInPlace pyproject.toml \
                 --replace "bakery = { git = \"https://github.com/syvlorg/bakery.git\", branch = \"main\" }" ""
@@ -7,6 +7,8 @@ package_data = {"": ["*"]}
 
 install_requires = ["bakery @ git+https://github.com/syvlorg/bakery.git@main"]
 
+extras_require = {"compression": ["lz4", "zstandard"]}
+
 setup_kwargs = {
     "name": "strapper",
     "version": "1.0.0.0",
@@ -20,7 +22,8 @@ setup_kwargs = {
     "packages": packages,
     "package_data": package_data,
     "install_requires": install_requires,
-    "python_requires": ">=3.9,<3.11",
+    "extras_require": extras_require,
+    "python_requires": ">=3.11,<4.0",
 }
 
 
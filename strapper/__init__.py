@@ -1,21 +1,51 @@
 #!/usr/bin/env python3
-import rich.traceback as RichTraceback
+from importlib import import_module
 
-RichTraceback.install(show_locals=True)
+# Everything from `strapper.strapper', along with its macros, is only loaded the first
+# time something is asked of this package; importing the package itself costs nothing.
+_loaded = False
 
-import hy
 
-hy.macros.require(
-    "strapper.strapper",
-    # The Python equivalent of `(require strapper.strapper *)`
-    None,
-    assignments="ALL",
-    prefix="",
-)
-hy.macros.require_reader("strapper.strapper", None, assignments="ALL")
-from strapper.strapper import *
+def _load():
+    global _loaded
+    if not _loaded:
+        import hy
+
+        hy.macros.require(
+            "strapper.strapper",
+            # The Python equivalent of `(require strapper.strapper *)`
+            None,
+            assignments="ALL",
+            prefix="",
+        )
+        hy.macros.require_reader("strapper.strapper", None, assignments="ALL")
+        module = import_module("strapper.strapper")
+        globals().update(
+            {
+                name: getattr(module, name)
+                for name in getattr(module, "__all__", dir(module))
+                if not name.startswith("_")
+            }
+        )
+        _loaded = True
+
+
+def __getattr__(name):
+    # Submodules, such as `strapper.plan', are imported on their own by `from strapper
+    # import ...' once this fails, without loading everything else.
+    from importlib.util import find_spec
+
+    if name.startswith("__") or find_spec(f"{__name__}.{name}") is not None:
+        raise AttributeError(name)
+    _load()
+    try:
+        return globals()[name]
+    except KeyError:
+        raise AttributeError(f"module 'strapper' has no attribute '{name}'") from None
 
-from addict import Dict
 
 if __name__ == "__main__":
+    from addict import Dict
+
+    _load()
     tailapi(obj=Dict())
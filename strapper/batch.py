@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+import click
+import os
+import sys
+import time
+
+from multiprocessing import get_context
+from multiprocessing.connection import wait
+from pathlib import Path
+
+from strapper.lazy import lazy
+from strapper.plan import compile_plan
+from strapper.strapper import create, strapper
+
+Dict = lazy("addict", "Dict")
+json = lazy("orjson")
+yaml = lazy("yaml")
+
+
+def arguments(command, options):
+    # Turns a host's options in the manifest, named like `command''s long options,
+    # into its command line; lists repeat an option, or fill one taking several values.
+    params = {param.name: param for param in command.params}
+    argv = []
+    for [key, value] in options.items():
+        if (param := params.get(key.replace("-", "_"))) is None:
+            raise click.UsageError(
+                f"Sorry; `{command.name}' has no option called `{key}'!"
+            )
+        flag = "--" + key.replace("_", "-")
+        if value is None or value is False:
+            continue
+        if value is True:
+            argv.append(flag)
+        elif param.multiple:
+            for item in value if isinstance(value, list) else [value]:
+                argv += [flag, str(item)]
+        elif isinstance(value, list):
+            argv += [flag, *map(str, value)]
+        else:
+            argv += [flag, str(value)]
+    return argv
+
+
+def read_manifest(path):
+    # hosts: [{host: <name>, <option of `create'>: <value>, ...}, ...], along with any
+    # `defaults' for the options of every host; JSON is YAML too.
+    manifest = yaml.safe_load(Path(path).read_text()) or dict()
+    defaults = manifest.get("defaults") or dict()
+    hosts = []
+    for entry in manifest.get("hosts") or ():
+        options = defaults | entry
+        if not (host := options.pop("host", None)):
+            raise click.UsageError(f"Sorry; every host in {path} needs a `host'!")
+        hosts.append((host, options))
+    return hosts
+
+
+# Installing mounts everything under, and installs into, `/mnt', which every host would
+# share; provision in batches, then install each host on its own.
+exclusive = ("install", "install-bootloader")
+
+
+def own_root(host, options):
+    # Each pool gets a root of its own, unless the manifest gives it one, so that no
+    # host's datasets mount over, or get unmounted along with, another's.
+    key = "pool_options" if "pool_options" in options else "pool-options"
+    pool_options = options.get(key) or []
+    if not isinstance(pool_options, list):
+        pool_options = [pool_options]
+    if not any(str(option).startswith("altroot=") for option in pool_options):
+        options[key] = [
+            *pool_options,
+            "altroot=" + str(Path("/mnt", "strapper-batch", host)),
+        ]
+    return options
+
+
+def provision(host, argv, log):
+    # Runs in a process of its own, forked from the one that compiled the plans; everything
+    # the host's commands print, and everything their programs print, goes to its log.
+    start = time.perf_counter()
+    with open(log, "ab", buffering=0) as f:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(f.fileno(), 1)
+        os.dup2(f.fileno(), 2)
+        try:
+            strapper.main(args=argv, obj=Dict(), standalone_mode=False)
+            error = None
+        except click.ClickException as exception:
+            exception.show()
+            error = exception.format_message()
+        except Exception as exception:
+            error = f"{type(exception).__name__}: {exception}"
+            print(error, file=sys.stderr)
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return dict(host=host, seconds=time.perf_counter() - start, error=error, log=log)
+
+
+def child(writer, host, argv, log):
+    writer.send(provision(host, argv, log))
+    writer.close()
+
+
+@click.command()
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=2,
+    show_default=True,
+    help="The number of hosts to provision at once; keep it low enough not to saturate the disk bus",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(file_okay=False),
+    default="strapper-batch",
+    show_default=True,
+    help="Where each host gets a log, a trace with `-t', and a resources directory for its datasets.nix unless the manifest says otherwise",
+)
+@click.option("-t", "--trace", is_flag=True, help="Trace every host's commands")
+def batch(manifest, jobs, output, trace):
+    # Creates the pool of every host in the manifest, `jobs' at a time. The resources
+    # are read, and each host's plan compiled, once, here; each host gets a process of
+    # its own, forked from this one, so it starts with all of that, and with strapper
+    # already imported, and nothing one host's commands change leaks into another's.
+    output = Path(output).absolute()
+    output.mkdir(parents=True, exist_ok=True)
+    hosts = read_manifest(manifest)
+    work = []
+    for [host, options] in hosts:
+        if taken := [
+            key
+            for [key, value] in options.items()
+            if value and key.replace("_", "-") in exclusive
+        ]:
+            raise click.UsageError(
+                f"Sorry; {host} can't `{taken[0]}' in a batch, since every host would install into /mnt!"
+            )
+        own_root(host, options)
+        group = ["-H", host]
+        resources = options.pop("resources-dir", None) or output / host
+        Path(resources).mkdir(parents=True, exist_ok=True)
+        group += ["-r", str(resources)]
+        if trace:
+            group += ["-t", str(output / (host + ".trace.json"))]
+        argv = [*group, "create", "--yes", *arguments(create, options)]
+        compile_plan(
+            host,
+            encrypted=bool(options.get("encrypted")),
+            deduplicated=bool(options.get("deduplicated")),
+        )
+        work.append((host, argv, str(output / (host + ".log"))))
+    results = []
+    start = time.perf_counter()
+    context = get_context("fork")
+    running = dict()
+    pending = iter(work)
+
+    def start_next():
+        if job := next(pending, None):
+            [reader, writer] = context.Pipe(duplex=False)
+            process = context.Process(target=child, args=(writer, *job))
+            process.start()
+            writer.close()
+            running[process.sentinel] = (process, reader, job)
+
+    for _ in range(jobs):
+        start_next()
+    while running:
+        for sentinel in wait(list(running)):
+            [process, reader, [host, _, log]] = running.pop(sentinel)
+            process.join()
+            result = (
+                reader.recv()
+                if reader.poll()
+                else dict(
+                    host=host,
+                    seconds=time.perf_counter() - start,
+                    error=f"exited with {process.exitcode}",
+                    log=log,
+                )
+            )
+            reader.close()
+            results.append(result)
+            print(
+                f"{result['host']:<24}{result['seconds']:9.2f}s",
+                f"failed: {result['error']}" if result["error"] else "done",
+                f"({result['log']})",
+            )
+            start_next()
+    (output / "results.json").write_bytes(json.dumps(results))
+    failed = [result["host"] for result in results if result["error"]]
+    print(
+        f"Provisioned {len(results) - len(failed)} of {len(results)} hosts in {time.perf_counter() - start:.2f}s."
+    )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    batch()
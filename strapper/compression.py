@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+
+from importlib.util import find_spec
+from pathlib import Path
+
+from strapper.files import config_dir, write_atomic
+from strapper.inventory import parse_size
+from strapper.lazy import lazy
+from strapper.profiles import profiles
+
+futures = lazy("concurrent.futures")
+json = lazy("orjson")
+lz4_block = lazy("lz4.block")
+zstandard = lazy("zstandard")
+
+# The compression of datasets without a profile, inherited from the pool's root dataset.
+default = "default"
+default_compression = "zstd-19"
+default_recordsize = 128 * 1024
+
+# The `zstd-fast' levels worth trying, out of the ones ZFS knows.
+fast_levels = (1, 5, 10, 50, 100, 500, 1000)
+
+
+def tuning_path():
+    return config_dir("compression.json")
+
+
+def load_tuning(path=None):
+    # dataset class, i.e. `default' or a profile -> the compression chosen for it
+    try:
+        return json.loads(Path(path or tuning_path()).read_bytes())
+    except (OSError, ValueError):
+        return dict()
+
+
+def save_tuning(tuning, path=None):
+    write_atomic(path or tuning_path(), json.dumps(tuning, option=json.OPT_SORT_KEYS))
+
+
+def recordsize(cls):
+    for option in profiles.get(cls, ()):
+        [prop, value] = option.partition("=")[::2]
+        if prop == "recordsize":
+            return parse_size(value)
+    return default_recordsize
+
+
+def sample_blocks(paths, recordsize=default_recordsize, limit=256 * 1024**2):
+    # Splits the files under `paths' into blocks the way ZFS would: files smaller than
+    # the recordsize are a single block of their own size, and larger ones are split into
+    # whole records. Stops after `limit' bytes.
+    blocks = []
+    total = 0
+    for root in paths:
+        for [directory, _, files] in os.walk(root):
+            for name in sorted(files):
+                path = os.path.join(directory, name)
+                if os.path.islink(path) or not os.path.isfile(path):
+                    continue
+                try:
+                    with open(path, "rb") as f:
+                        while block := f.read(min(recordsize, limit - total)):
+                            blocks.append(block)
+                            total += len(block)
+                            if total >= limit:
+                                return blocks
+                except OSError:
+                    continue
+    return blocks
+
+
+_compressors = threading.local()
+
+
+def zstd(level, data):
+    # Compressors can't be shared between threads, so each thread keeps its own.
+    cache = _compressors.__dict__
+    if (compressor := cache.get(level)) is None:
+        compressor = cache[level] = zstandard.ZstdCompressor(level=level)
+    return compressor.compress(data)
+
+
+def codecs():
+    # ZFS compression name -> function, for every codec whose module is installed.
+    available = dict()
+    if find_spec("lz4"):
+        available["lz4"] = lambda data: lz4_block.compress(data, store_size=False)
+    if find_spec("zstandard"):
+        for level in fast_levels:
+            available[f"zstd-fast-{level}"] = lambda data, level=-level: zstd(
+                level, data
+            )
+        for level in range(1, 20):
+            available[f"zstd-{level}"] = lambda data, level=level: zstd(level, data)
+    return available
+
+
+def allocated(size, sector):
+    return -(-size // sector) * sector
+
+
+def stored(block, compressed, sector):
+    # ZFS only keeps the compressed block when it saves at least an eighth of the block,
+    # and allocates whole sectors either way.
+    if compressed <= block - block // 8:
+        return allocated(compressed, sector)
+    return allocated(block, sector)
+
+
+def measure(blocks, compress, jobs=1, sector=4096):
+    # (compression ratio, throughput in MB/s on `jobs' threads)
+    def run(chunk):
+        return [stored(len(block), len(compress(block)), sector) for block in chunk]
+
+    chunks = [blocks[i::jobs] for i in range(jobs)]
+    start = time.perf_counter()
+    with futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        sizes = [size for result in executor.map(run, chunks) for size in result]
+    seconds = time.perf_counter() - start
+    logical = sum(allocated(len(block), sector) for block in blocks)
+    return logical / max(1, sum(sizes)), sum(map(len, blocks)) / 1e6 / seconds
+
+
+def recommend(results, minimum):
+    # The best ratio that still compresses at `minimum' MB/s, preferring the faster of
+    # two levels with the same ratio to two decimals; failing that, the fastest level.
+    fast_enough = [
+        (round(ratio, 2), speed, name)
+        for [name, [ratio, speed]] in results.items()
+        if speed >= minimum
+    ]
+    if fast_enough:
+        return max(fast_enough)[2]
+    return max(results.items(), key=lambda item: item[1][1])[0]
@@ -0,0 +1,133 @@
+import os
+import threading
+
+from heapq import heappush, heapreplace
+
+from strapper.compression import default_recordsize
+from strapper.diff import split_options
+from strapper.inventory import parse_size
+from strapper.lazy import lazy
+
+futures = lazy("concurrent.futures")
+hashlib = lazy("hashlib")
+
+# What each unique block costs in memory while its dedup table entry is in core.
+ddt_entry_size = 320
+
+
+class Sketch:
+    # Keeps the `size' smallest distinct block hashes seen, which counts the unique
+    # blocks exactly up to `size' of them, and estimates the count well past that in
+    # the same, bounded, memory. Sketches of different data merge into one of all of it.
+    __slots__ = ("size", "heap", "members", "blocks", "bytes", "zeros")
+
+    def __init__(self, size=2**16):
+        self.size = size
+        self.heap = []
+        self.members = set()
+        self.blocks = 0
+        self.bytes = 0
+        self.zeros = 0
+
+    def add(self, value):
+        if value in self.members:
+            return
+        if len(self.heap) < self.size:
+            heappush(self.heap, -value)
+            self.members.add(value)
+        elif value < -self.heap[0]:
+            self.members.discard(-heapreplace(self.heap, -value))
+            self.members.add(value)
+
+    def update(self, other):
+        for value in other.members:
+            self.add(value)
+        self.blocks += other.blocks
+        self.bytes += other.bytes
+        self.zeros += other.zeros
+        return self
+
+    def unique(self):
+        if len(self.heap) < self.size:
+            return len(self.heap)
+        return round((self.size - 1) * 2**64 / (-self.heap[0] + 1))
+
+    def ratio(self):
+        return self.blocks / max(1, self.unique())
+
+
+def effective(plan, prop, fallback=None):
+    # The value of `prop' on each node of `plan', set there or inherited from a parent.
+    values = []
+    for node in plan:
+        options = split_options(node.options)
+        values.append(
+            options[prop]
+            if prop in options
+            else (values[node.parent] if node.parent >= 0 else fallback)
+        )
+    return values
+
+
+def scan(paths, recordsize=default_recordsize, jobs=1, size=2**16):
+    # Hashes every recordsize block of the files under `paths' on `jobs' threads, each
+    # reading its own files a block at a time into its own sketch. All-zero blocks are
+    # written as holes when compression is on, so they are counted apart.
+    files = (
+        os.path.join(directory, name)
+        for root in paths
+        for [directory, _, names] in os.walk(root)
+        for name in names
+    )
+    lock = threading.Lock()
+
+    def work():
+        sketch = Sketch(size)
+        while True:
+            with lock:
+                if (path := next(files, None)) is None:
+                    return sketch
+            if os.path.islink(path) or not os.path.isfile(path):
+                continue
+            try:
+                with open(path, "rb") as f:
+                    while block := f.read(recordsize):
+                        if block.count(0) == len(block):
+                            sketch.zeros += 1
+                            continue
+                        sketch.blocks += 1
+                        sketch.bytes += len(block)
+                        sketch.add(
+                            int.from_bytes(
+                                hashlib.blake2b(block, digest_size=8).digest(),
+                                "little",
+                            )
+                        )
+            except OSError:
+                continue
+
+    with futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        sketches = [executor.submit(work) for _ in range(jobs)]
+        total = Sketch(size)
+        for sketch in sketches:
+            total.update(sketch.result())
+    return total
+
+
+def estimate(plan, samples, jobs=1, size=2**16):
+    # dataset -> its sketch, for each dataset of `plan' in `samples', a dict of datasets
+    # to directories of data like what they will hold, scanned in their own recordsize.
+    recordsizes = effective(plan, "recordsize")
+    return {
+        dataset: scan(
+            paths,
+            (
+                parse_size(recordsize)
+                if (recordsize := recordsizes[plan.index[dataset]])
+                else default_recordsize
+            ),
+            jobs=jobs,
+            size=size,
+        )
+        for [dataset, paths] in samples.items()
+    }
@@ -0,0 +1,61 @@
+from strapper.inventory import Properties, normalize
+
+
+def split_options(options):
+    return dict(option.partition("=")[::2] for option in options)
+
+
+class Changes:
+    __slots__ = ("create", "set", "extra")
+
+    def __init__(self, create=(), set=(), extra=()):
+        # The plan nodes to create.
+        self.create = tuple(create)
+        # (dataset, property, desired value, current value)
+        self.set = tuple(set)
+        # Datasets on the pool that the plan doesn't know about; these are only reported.
+        self.extra = tuple(extra)
+
+    def __bool__(self):
+        return bool(self.create or self.set)
+
+    def render(self):
+        lines = []
+        for node in self.create:
+            lines.append(
+                " ".join(
+                    (
+                        "+",
+                        node.name,
+                        *(("from", node.origin) if node.origin else ()),
+                        *node.options,
+                    )
+                )
+            )
+        for [dataset, prop, value, current] in self.set:
+            lines.append(f"~ {dataset} {prop}={value} (currently {current})")
+        for dataset in self.extra:
+            lines.append(f"? {dataset} (not in the plan)")
+        return "\n".join(lines) or "Nothing to do!"
+
+
+def diff_plan(plan, inventory, properties=None, ignore=()):
+    if properties is None:
+        properties = Properties.load(plan.host)
+    create = []
+    changes = []
+    for node in plan:
+        if node.name in inventory:
+            current = properties[node.name]
+            for [prop, value] in split_options(node.options).items():
+                if prop in current and current[prop] != normalize(prop, value):
+                    changes.append((node.name, prop, value, current[prop]))
+        else:
+            create.append(node)
+    ignore = {plan.host, *ignore}
+    extra = sorted(
+        dataset
+        for dataset in inventory
+        if not (dataset in plan.index or dataset in ignore or "@" in dataset)
+    )
+    return Changes(create, changes, extra)
@@ -0,0 +1,71 @@
+import os
+
+from pathlib import Path
+
+from strapper.lazy import lazy
+
+hashlib = lazy("hashlib")
+tempfile = lazy("tempfile")
+
+
+def digest(data):
+    return hashlib.sha256(data).digest()
+
+
+def file_digest(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").digest()
+    except FileNotFoundError:
+        return None
+
+
+def user_dir(variable, fallback, *parts):
+    # strapper's directory under the XDG base directory `variable' names, or under
+    # `fallback' when it's unset, and whatever `parts' name in it.
+    return Path(os.environ.get(variable) or fallback, "strapper", *parts)
+
+
+def cache_dir(*parts):
+    return user_dir("XDG_CACHE_HOME", Path.home() / ".cache", *parts)
+
+
+def config_dir(*parts):
+    return user_dir("XDG_CONFIG_HOME", Path.home() / ".config", *parts)
+
+
+def runtime_dir(*parts):
+    return user_dir("XDG_RUNTIME_DIR", "/run", *parts)
+
+
+def write_atomic(path, content):
+    # A failed or concurrent write never leaves a truncated file behind, and a file
+    # that was already there keeps its mode.
+    path = Path(path)
+    data = content.encode() if isinstance(content, str) else content
+    path.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(
+        dir=path.parent, prefix="." + path.name + "."
+    )
+    try:
+        with os.fdopen(descriptor, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(temporary, path.stat().st_mode & 0o7777)
+        except FileNotFoundError:
+            os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        Path(temporary).unlink(missing_ok=True)
+        raise
+
+
+def write_if_changed(path, content):
+    # Returns whether the file was replaced; an unchanged file keeps its mtime.
+    data = content.encode() if isinstance(content, str) else content
+    if file_digest(path) == digest(data):
+        return False
+    write_atomic(path, data)
+    return True
@@ -0,0 +1,188 @@
+import subprocess
+import time
+
+from strapper.trace import tracer
+
+
+def run_query(argv):
+    # Queries always run, even when only printing commands, and are traced like bakery's.
+    start = time.perf_counter_ns()
+    process = subprocess.run(
+        argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    if tracer.enabled:
+        tracer.record(
+            list(argv),
+            start,
+            time.perf_counter_ns(),
+            process.returncode,
+            len(process.stdout),
+        )
+    return process
+
+
+def imported(pool):
+    # `zpool list' of a single pool only looks at that pool, however many datasets and
+    # snapshots it, or any other pool, has.
+    return not run_query(("zpool", "list", "-H", "-o", "name", pool)).returncode
+
+
+def stream(root=None, types=("filesystem", "volume"), depth=None, columns=("name",)):
+    # Yields the rows of `zfs list' as `zfs' prints them, rather than once it's done;
+    # closing the generator early, e.g. by breaking out of a loop, stops `zfs' as well.
+    argv = ["zfs", "list", "-H", "-o", ",".join(columns), "-t", ",".join(types)]
+    if depth is not None:
+        argv += ["-d", str(depth)]
+    elif root:
+        argv.append("-r")
+    if root:
+        argv.append(root)
+    start = time.perf_counter_ns()
+    size = 0
+    process = subprocess.Popen(
+        argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    try:
+        for line in process.stdout:
+            size += len(line)
+            row = line.rstrip("\n").split("\t")
+            yield row[0] if len(columns) == 1 else row
+    finally:
+        if process.poll() is None:
+            process.terminate()
+        process.stdout.close()
+        process.wait()
+        if tracer.enabled:
+            tracer.record(argv, start, time.perf_counter_ns(), process.returncode, size)
+
+
+class Inventory:
+    # The pool's datasets, from its properties, kept up to date in place as datasets are
+    # created, so that membership checks never have to go back to `zfs'.
+    __slots__ = ("datasets",)
+
+    def __init__(self, datasets=()):
+        self.datasets = set(datasets)
+
+    def __contains__(self, dataset):
+        return dataset in self.datasets
+
+    def __iter__(self):
+        return iter(self.datasets)
+
+    def __len__(self):
+        return len(self.datasets)
+
+    def add(self, dataset):
+        self.datasets.add(dataset)
+
+    def discard(self, dataset):
+        self.datasets.discard(dataset)
+
+
+# Properties whose values `-p' reports in bytes.
+size_properties = frozenset(
+    (
+        "quota",
+        "refquota",
+        "refreservation",
+        "reservation",
+        "recordsize",
+        "special_small_blocks",
+        "volblocksize",
+        "volsize",
+    )
+)
+
+units = {unit: 1024**power for [power, unit] in enumerate("BKMGTPEZ")}
+
+
+def parse_size(value):
+    # Human-readable sizes such as `1.5T' or `512G' in bytes; `none' is 0.
+    value = value.strip().upper().removesuffix("IB").removesuffix("B") or "0"
+    if value == "NONE":
+        return 0
+    if value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(float(value))
+
+
+def normalize(prop, value):
+    # The value as `zfs get -p' would report it.
+    if prop in size_properties:
+        try:
+            return str(parse_size(value))
+        except ValueError:
+            pass
+    return value
+
+
+class Properties:
+    # Every property of every dataset of a pool, and of the pool itself, from a single
+    # `zfs get -Hp' and a single `zpool get -Hp', with values as exact as `-p' makes them.
+    __slots__ = ("datasets", "pool")
+
+    def __init__(self, datasets=None, pool=None):
+        self.datasets = datasets or dict()
+        self.pool = pool or dict()
+
+    @staticmethod
+    def parse(lines):
+        table = dict()
+        for line in lines or ():
+            [name, prop, value] = (line.split("\t", 2) + ["", ""])[:3]
+            if prop:
+                table.setdefault(name, dict())[prop] = value
+        return table
+
+    @classmethod
+    def load(cls, pool):
+        # Read-only, so run even when only printing commands, as `run_query' does.
+        return cls(
+            cls.parse(
+                run_query(
+                    (
+                        "zfs",
+                        "get",
+                        "-r",
+                        "-H",
+                        "-p",
+                        "-o",
+                        "name,property,value",
+                        "-t",
+                        "filesystem,volume",
+                        "all",
+                        pool,
+                    )
+                ).stdout.splitlines()
+            ),
+            cls.parse(
+                run_query(
+                    (
+                        "zpool",
+                        "get",
+                        "-H",
+                        "-p",
+                        "-o",
+                        "name,property,value",
+                        "all",
+                        pool,
+                    )
+                ).stdout.splitlines()
+            ).get(pool),
+        )
+
+    def __getitem__(self, dataset):
+        return self.datasets.get(dataset, dict())
+
+    def __contains__(self, dataset):
+        return dataset in self.datasets
+
+    def get(self, dataset, prop, default=None):
+        return self.datasets.get(dataset, dict()).get(prop, default)
+
+    def inventory(self):
+        return Inventory(self.datasets)
+
+    def pool_bytes(self, prop="size"):
+        return int(self.pool[prop])
@@ -0,0 +1,27 @@
+from importlib import import_module
+
+
+class lazy:
+    # Stands in for a module, or for something in a module, and only imports it the
+    # first time it is used; this keeps `strapper --help' and argument validation fast.
+    __slots__ = ("_module", "_name", "_target")
+
+    def __init__(self, module, name=None):
+        self._module = module
+        self._name = name
+        self._target = None
+
+    def _load(self):
+        if self._target is None:
+            target = import_module(self._module)
+            self._target = getattr(target, self._name) if self._name else target
+        return self._target
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __repr__(self):
+        return f"lazy({self._module!r}, {self._name!r})"
@@ -0,0 +1,203 @@
+import os
+import re
+import threading
+
+from pathlib import Path, PurePosixPath
+
+from strapper.diff import split_options
+from strapper.scheduler import run_graph
+from strapper.trace import program
+
+mount = program("mount")
+umount = program("umount")
+
+
+def system_root():
+    # `STRAPPER_SYSTEM_ROOT' stands in for `/' of the live system, such as a directory
+    # the benchmarks mount into; the target's root, and the live mountpoints, are in it.
+    return os.environ.get("STRAPPER_SYSTEM_ROOT", "/")
+
+
+def mountinfo_path():
+    return os.environ.get("STRAPPER_MOUNTINFO", "/proc/self/mountinfo")
+
+
+def unescape(field):
+    # `/proc/self/mountinfo' escapes spaces, tabs, newlines and backslashes in octal.
+    return re.sub(r"\\([0-7]{3})", lambda match: chr(int(match[1], 8)), field)
+
+
+def mounted(mountinfo=None):
+    # mountpoint -> mount source, for everything mounted right now
+    table = dict()
+    try:
+        with open(mountinfo or mountinfo_path()) as f:
+            for line in f:
+                [before, _, after] = line.partition(" - ")
+                fields = before.split()
+                sources = after.split()
+                if len(fields) > 4:
+                    table[unescape(fields[4])] = (
+                        unescape(sources[1]) if len(sources) > 1 else ""
+                    )
+    except FileNotFoundError:
+        pass
+    return table
+
+
+def binds(mountinfo=None):
+    # bind mount -> the path it was bound from: any later mount of a filesystem already
+    # mounted, at the same root within it or under that root, is a bind of the first.
+    first = dict()
+    table = dict()
+    try:
+        with open(mountinfo or mountinfo_path()) as f:
+            for line in f:
+                fields = line.partition(" - ")[0].split()
+                if len(fields) <= 4:
+                    continue
+                [device, root, target] = [
+                    fields[2],
+                    unescape(fields[3]),
+                    unescape(fields[4]),
+                ]
+                if not device in first:
+                    first[device] = (target, root)
+                    continue
+                [origin, origin_root] = first[device]
+                if root == origin_root:
+                    table[target] = origin
+                elif root.startswith(origin_root.rstrip("/") + "/"):
+                    table[target] = (
+                        origin.rstrip("/") + root[len(origin_root.rstrip("/")) :]
+                    )
+    except FileNotFoundError:
+        pass
+    return table
+
+
+class Mount:
+    __slots__ = ("source", "target", "fstype", "bind", "run")
+
+    def __init__(self, source, target, fstype=None, bind=False, run=False):
+        self.source = source
+        self.target = target
+        self.fstype = fstype
+        self.bind = bind
+        # Mounts on the live system, rather than the target, are made even when only
+        # printing commands, as the original `mount' command did for `/tmp'.
+        self.run = run
+
+    def __repr__(self):
+        return f"Mount({self.source!r}, {self.target!r})"
+
+
+def legacy(plan):
+    # Whether each dataset's mountpoint is, or is inherited as, `legacy'; only those
+    # datasets are mounted with `mount'.
+    flags = []
+    for node in plan:
+        options = split_options(node.options)
+        if "mountpoint" in options:
+            flags.append(options["mountpoint"] == "legacy")
+        else:
+            flags.append(flags[node.parent] if node.parent >= 0 else False)
+    return flags
+
+
+def mount_plan(plan, root_device=None, boot_device=None, root=None, live=("/tmp",)):
+    # Mountpoints under any of `live' are mounted on the live system itself, so that
+    # builds during the installation use the pool instead of memory.
+    system = system_root()
+    root = root or os.path.join(system, "mnt")
+
+    def target(mountpoint):
+        if any(
+            mountpoint == path or mountpoint.startswith(path + "/") for path in live
+        ):
+            return os.path.join(system, mountpoint.lstrip("/")), True
+        return root + mountpoint, False
+
+    mounts = [
+        Mount(root_device, root)
+        if root_device
+        else Mount(plan.host + "/system/root", root, "zfs")
+    ]
+    # Adapted From: https://github.com/NixOS/nixpkgs/issues/73404#issuecomment-1011485428
+    mounts.append(Mount(root, root + root, bind=True))
+    for [node, is_legacy] in zip(plan, legacy(plan)):
+        if not is_legacy:
+            continue
+        if node.homes:
+            [first, *others] = (target(home) for home in node.homes)
+            mounts.append(Mount(node.name, first[0], "zfs", run=first[1]))
+            mounts.extend(
+                Mount(first[0], path, bind=True, run=run) for [path, run] in others
+            )
+        elif node.mountpoint:
+            [path, run] = target(node.mountpoint)
+            mounts.append(Mount(node.name, path, "zfs", run=run))
+    if boot_device:
+        mounts.append(Mount(boot_device, root + "/boot/efi"))
+    return mounts
+
+
+def mount_dependencies(mounts):
+    # Each mount waits on the closest mount above it and, when binding, on its source.
+    targets = {m.target: i for [i, m] in enumerate(mounts)}
+    for m in mounts:
+        depends = set()
+        for parent in PurePosixPath(m.target).parents:
+            if (i := targets.get(str(parent))) is not None:
+                depends.add(i)
+                break
+        if m.bind and (i := targets.get(m.source)) is not None:
+            depends.add(i)
+        yield depends
+
+
+def same_source(m, source):
+    if m.bind:
+        return True
+    if m.source.startswith("/"):
+        return os.path.realpath(m.source) == os.path.realpath(source)
+    return m.source == source
+
+
+def mount_all(mounts, jobs=1, current=None, root=None):
+    # `current' is read from `/proc/self/mountinfo' once; anything already mounted from
+    # the right source is left alone, and anything else mounted in the way under `root'
+    # is unmounted. Mounts on the live system, such as its `/tmp', are never unmounted,
+    # only mounted over, as the original `mount' command did.
+    current = mounted() if current is None else current
+    root = root or os.path.join(system_root(), "mnt")
+    lock = threading.Lock()
+
+    def mount_one(m):
+        if m.target in current and (
+            m.target == root or m.target.startswith(root.rstrip("/") + "/")
+        ):
+            umount(m.target, R=True)
+            with lock:
+                for target in [
+                    target
+                    for target in current
+                    if target == m.target or target.startswith(m.target + "/")
+                ]:
+                    del current[target]
+        Path(m.target).mkdir(parents=True, exist_ok=True)
+        kwargs = dict(_run=True) if m.run else dict()
+        if m.fstype:
+            kwargs["t"] = m.fstype
+        if m.bind:
+            kwargs["bind"] = True
+        mount(m.source, m.target, **kwargs)
+        return m.target
+
+    return run_graph(
+        mounts,
+        list(mount_dependencies(mounts)),
+        mount_one,
+        jobs=jobs,
+        skip=lambda m: m.target in current and same_source(m, current[m.target]),
+    )
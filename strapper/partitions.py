@@ -0,0 +1,108 @@
+import os
+
+from pathlib import Path
+
+from strapper.scheduler import run_graph
+from strapper.trace import program
+
+mkfs = program("mkfs")
+mkswap = program("mkswap")
+parted = program("parted")
+udevadm = program("udevadm")
+
+
+def partlabel(name):
+    # The partition named `name' in its partition table, which is there as soon as udev
+    # settles, filesystem or not.
+    return "/dev/disk/by-partlabel/" + name
+
+
+def layout(partition, name):
+    # The `parted' commands for a whole disk: the partitions ending at each of
+    # `partition', then the ZFS partition, named `name', filling the rest of the disk.
+    # The first partition is the boot partition, and the second, if any, is swap.
+    commands = [("mklabel", "gpt")]
+    for [i, end] in enumerate(partition):
+        commands.append(("mkpart", "primary", partition[i - 1] if i else "0%", end))
+    commands.append(("mkpart", "primary", partition[-1], "100%"))
+    commands.append(("name", len(partition) + 1, name))
+    return commands
+
+
+def boot_commands(number, name=None):
+    # `parted' no longer makes filesystems; `format_boot' does, once the table is written.
+    return [
+        *((("name", number, name),) if name else ()),
+        ("set", number, "boot", "on"),
+        ("set", number, "esp", "on"),
+    ]
+
+
+def swap_commands(number, name=None):
+    return [*((("name", number, name),) if name else ())]
+
+
+def format_partitions(partitions, make, jobs=1):
+    run_graph(partitions, [set() for _ in partitions], make, jobs=jobs)
+    return partitions
+
+
+def format_boot(partitions, jobs=1):
+    return format_partitions(
+        partitions, lambda partition: mkfs(partition, t="vfat", F="32"), jobs=jobs
+    )
+
+
+def format_swap(partitions, jobs=1):
+    return format_partitions(partitions, mkswap, jobs=jobs)
+
+
+def partition_disks(scripts, jobs=1):
+    # `scripts' maps each disk to the `parted' commands to run on it, in order.
+    # Each disk gets a single `parted -s' invocation running all of its commands, so its
+    # partition table is read and written once; the disks are partitioned concurrently,
+    # and udev is waited on once, after all of them, for their partitions to show up.
+    parted.bake_("--", _sudo=True, s=True, a="optimal")
+    devices = list(scripts)
+    run_graph(
+        devices,
+        [set() for _ in devices],
+        lambda device: parted(
+            device, *(str(arg) for command in scripts[device] for arg in command)
+        ),
+        jobs=jobs,
+    )
+    if devices:
+        udevadm.settle()
+    return devices
+
+
+def sysfs_dir():
+    # `STRAPPER_SYSFS' points at a copy of `/sys/class/block' to read instead, such as
+    # one made up to try out device detection offline.
+    return Path(os.environ.get("STRAPPER_SYSFS", "/sys/class/block"))
+
+
+def physical_block_size(device, sysfs=None):
+    # Partitions have no `queue' of their own, so their disk's is used instead.
+    path = Path(sysfs or sysfs_dir(), os.path.basename(os.path.realpath(device)))
+    if not (path / "queue").exists():
+        path = path.resolve().parent
+    try:
+        return int((path / "queue" / "physical_block_size").read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def ashift(devices, sysfs=None, minimum=12):
+    # The smallest ashift covering the largest physical sector of `devices', or `None'
+    # when none of them can be found. Plenty of drives claim 512-byte sectors while
+    # really using 4K ones, and 4K costs the rest little, hence the minimum.
+    sizes = [
+        size
+        for device in devices
+        if (size := physical_block_size(device, sysfs)) is not None
+    ]
+    if not sizes:
+        return None
+    return max(minimum, *((size - 1).bit_length() for size in sizes))
@@ -0,0 +1,293 @@
+import os
+
+from pathlib import Path
+
+from strapper.compression import load_tuning
+from strapper.files import cache_dir, write_atomic
+from strapper.lazy import lazy
+from strapper.profiles import profile_options, profiles
+
+hashlib = lazy("hashlib")
+json = lazy("orjson")
+resources = lazy("importlib.resources")
+yaml = lazy("yaml")
+
+resource_names = (
+    "datasets.yaml",
+    "user_datasets.yaml",
+    "username.txt",
+    "users.json",
+    "homes.json",
+)
+reserved = "reserved"
+
+# These datasets are not written to `datasets.nix', and are stripped from the front of
+# any dataset name used to derive a mountpoint.
+prefixes = (
+    "system",
+    "system/root",
+    "swap",
+    "base",
+    "omniverse",
+    reserved,
+)
+
+# Every user's own datasets are cloned from the snapshot of one of these, under
+# `${host}/templates'; clones only cost a little metadata however many users there are.
+templates = "templates"
+template_snapshot = "template"
+
+# Bump this whenever the layout of a cached plan changes.
+plan_version = 4
+
+
+class Node:
+    __slots__ = (
+        "key",
+        "dataset",
+        "name",
+        "mountpoint",
+        "homes",
+        "options",
+        "origin",
+        "parent",
+        "tags",
+    )
+
+    def __init__(
+        self, key, dataset, name, mountpoint, homes, options, origin, parent, tags=()
+    ):
+        self.key = key
+        # The dataset as written to `datasets.nix', i.e. with `${host}' left in.
+        self.dataset = dataset
+        # The real dataset on the pool.
+        self.name = name
+        # `None' when the dataset does not appear in `datasets.nix'.
+        self.mountpoint = mountpoint
+        # The mountpoints of each user when the dataset belongs to the primary user's tree.
+        self.homes = homes
+        self.options = options
+        # The snapshot to clone the dataset from, or `None' to create it.
+        self.origin = origin
+        # The index of the parent node, or -1 for a top-level dataset.
+        self.parent = parent
+        # The dataset's `tags' in `datasets.yaml', along with those of all its ancestors.
+        self.tags = tags
+
+    def __iter__(self):
+        return iter(getattr(self, slot) for slot in self.__slots__)
+
+    def __repr__(self):
+        return f"Node({self.name!r})"
+
+
+class Plan:
+    # A flattened dataset tree; every parent comes before its children.
+    __slots__ = ("host", "nodes", "_index")
+
+    def __init__(self, host, nodes):
+        self.host = host
+        self.nodes = tuple(nodes)
+        self._index = None
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __getitem__(self, i):
+        return self.nodes[i]
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = {node.name: i for [i, node] in enumerate(self.nodes)}
+        return self._index
+
+    def render(self, root_device=None):
+        lines = [
+            'host: { \n\t"',
+            (root_device or "${host}/system/root"),
+            '" = "/";\n',
+        ]
+        for node in self.nodes:
+            if node.homes:
+                lines += (
+                    '\t"',
+                    node.dataset,
+                    '" = [ ',
+                    " ".join('"' + home + '"' for home in node.homes),
+                    " ];\n",
+                )
+            elif node.mountpoint is not None:
+                lines += ('\t"', node.dataset, '" = "', node.mountpoint, '";\n')
+        lines.append("}")
+        return "".join(lines)
+
+
+def resources_dir():
+    # `STRAPPER_RESOURCES' points at a directory of resources to use instead of the
+    # packaged ones, such as the synthetic trees of the benchmarks.
+    if directory := os.environ.get("STRAPPER_RESOURCES"):
+        return Path(directory)
+    # Adapted From:
+    # Answer: https://stackoverflow.com/a/58941536/10827766
+    # User: https://stackoverflow.com/users/674039/wim
+    return resources.files("strapper.resources")
+
+
+def read_resources():
+    directory = resources_dir()
+    return {name: (directory / name).read_bytes() for name in resource_names}
+
+
+def plan_key(host, encrypted, deduplicated, sources, tuning=None):
+    key = hashlib.sha256()
+    key.update(
+        json.dumps([plan_version, host, encrypted, deduplicated, profiles, tuning])
+    )
+    for name in resource_names:
+        key.update(name.encode())
+        key.update(hashlib.sha256(sources[name]).digest())
+    return key.hexdigest()
+
+
+def plan_cache_dir():
+    return cache_dir("plans")
+
+
+def build_plan(host, sources, encrypted=False, deduplicated=False, tuning=None):
+    # `tuning' maps profiles to the compression `strapper tune-compression' chose for them.
+    tuning = tuning or dict()
+    datasets = yaml.safe_load(sources["datasets.yaml"].decode().strip())
+    datasets |= yaml.safe_load(sources["user_datasets.yaml"].decode().strip())
+    primary_user = sources["username.txt"].decode().strip()
+    users = json.loads(sources["users.json"].strip())
+    homes = json.loads(sources["homes.json"].strip())
+    datasets[host] = dict(
+        datasets=dict(jails=dict(datasets=dict(base=dict()))),
+        options=["mountpoint=legacy"],
+    )
+    datasets[templates] = dict(
+        datasets=dict(home=dict(), persist=dict(), podman=dict()),
+        options=["mountpoint=none", "canmount=off"],
+    )
+    system = datasets["system"]["datasets"]
+    for user in users.values():
+        system["home"].setdefault("datasets", dict())[user] = dict(template="home")
+        system["persist"].setdefault("datasets", dict())[user] = dict(
+            template="persist"
+        )
+        datasets["virt"]["datasets"]["podman"].setdefault("datasets", dict())[
+            user
+        ] = dict(template="podman")
+    skipped = {host + "/" + prefix for prefix in prefixes}
+    template_root = host + "/" + templates
+    host_user = host + "/" + primary_user
+    origin = (host + "/base@root") if (encrypted and deduplicated) else None
+    nodes = []
+
+    def recurse(ddict, dname, droot, mountpoint, parent, tags=()):
+        _dataset = droot + "/" + dname
+        _real_dataset = _dataset.replace("${host}", host)
+        _mountpoint = None
+        _homes = None
+        if not (
+            _real_dataset in skipped
+            or _real_dataset == template_root
+            or _real_dataset.startswith(template_root + "/")
+        ):
+            if _mountpoint := ddict.get("mountpoint", ""):
+                mountpoint = _mountpoint
+            elif mountpoint:
+                mountpoint = mountpoint + "/" + dname
+                _mountpoint = mountpoint
+            else:
+                _mountpoint = _dataset.removeprefix("${host}" + "/")
+                for prefix in prefixes:
+                    _mountpoint = _mountpoint.removeprefix(prefix + "/")
+                _mountpoint = "/" + _mountpoint
+            if _real_dataset.startswith(host_user) and (
+                not (_real_dataset == host_user)
+            ):
+                _homes = tuple(homes[user] + "/" + dname for user in users.keys())
+        index = len(nodes)
+        nodes.append(
+            Node(
+                dname,
+                _dataset,
+                _real_dataset,
+                _mountpoint,
+                _homes,
+                profile_options(
+                    profile := ddict.get("profile"),
+                    ddict.get("options", ()),
+                    tuning.get(profile),
+                ),
+                (
+                    f"{template_root}/{template}@{template_snapshot}"
+                    if (template := ddict.get("template"))
+                    else origin
+                    if dname != "base"
+                    else None
+                ),
+                parent,
+                tags := tuple(sorted({*tags, *ddict.get("tags", ())})),
+            )
+        )
+        for [key, value] in (ddict.get("datasets") or dict()).items():
+            recurse(value or dict(), key, _dataset, mountpoint, index, tags)
+
+    for [key, value] in datasets.items():
+        recurse(value or dict(), key, "${host}", "", -1)
+    return Plan(host, nodes)
+
+
+_plans = dict()
+
+
+def unpack_plan(host, rows):
+    # The inverse of `tuple(node) for node in plan', once through JSON.
+    return Plan(
+        host,
+        (
+            Node(*(tuple(field) if isinstance(field, list) else field for field in row))
+            for row in rows
+        ),
+    )
+
+
+def load_plan(host, path):
+    return unpack_plan(host, json.loads(path.read_bytes()))
+
+
+def save_plan(plan, path):
+    write_atomic(path, json.dumps([tuple(node) for node in plan]))
+
+
+def compile_plan(host, encrypted=False, deduplicated=False, cache_dir=None):
+    # The plan is cached both in-process and on disk, keyed by the content of the
+    # resources and the host, so only the first command of a session parses them.
+    sources = read_resources()
+    tuning = load_tuning()
+    key = plan_key(host, encrypted, deduplicated, sources, tuning)
+    if key in _plans:
+        return _plans[key]
+    cached = Path(cache_dir or plan_cache_dir(), key + ".json")
+    try:
+        plan = load_plan(host, cached)
+    except (OSError, ValueError, TypeError):
+        plan = build_plan(
+            host,
+            sources,
+            encrypted=encrypted,
+            deduplicated=deduplicated,
+            tuning=tuning,
+        )
+        try:
+            save_plan(plan, cached)
+        except OSError:
+            pass
+    _plans[key] = plan
+    return plan
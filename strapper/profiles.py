@@ -0,0 +1,54 @@
+# Named sets of dataset options for common workloads, referenced from a dataset in
+# `datasets.yaml' with `profile: <name>'; the dataset's own `options' win over its
+# profile's, and its descendants inherit both as usual.
+profiles = {
+    # Virtual machine disk images: small random writes, cached by the guest already.
+    "vm-images": (
+        "recordsize=64K",
+        "logbias=throughput",
+        "primarycache=metadata",
+        "compression=lz4",
+        "redundant_metadata=most",
+    ),
+    # Lots of small, read-mostly, very compressible files, written once by builds.
+    "nix-store": (
+        "recordsize=128K",
+        "logbias=latency",
+        "primarycache=all",
+        "compression=zstd-6",
+        "redundant_metadata=most",
+    ),
+    # Image layers unpacked often and read by many containers at once.
+    "container-layers": (
+        "recordsize=128K",
+        "logbias=latency",
+        "primarycache=all",
+        "compression=lz4",
+        "redundant_metadata=most",
+    ),
+    # Large, already compressed files, read and written sequentially.
+    "bulk-media": (
+        "recordsize=1M",
+        "logbias=throughput",
+        "primarycache=metadata",
+        "compression=lz4",
+        "redundant_metadata=most",
+    ),
+}
+
+
+def profile_options(profile, options=(), compression=None):
+    # The options of `profile', with its compression replaced by `compression' if given,
+    # overridden by any of `options', as a tuple of options.
+    if not profile:
+        return tuple(options)
+    try:
+        merged = dict(option.partition("=")[::2] for option in profiles[profile])
+    except KeyError:
+        raise ValueError(
+            f"Sorry; there is no profile called `{profile}'! Try one of: {', '.join(profiles)}"
+        ) from None
+    if compression:
+        merged["compression"] = compression
+    merged |= dict(option.partition("=")[::2] for option in options)
+    return tuple(f"{prop}={value}" for [prop, value] in merged.items())
@@ -0,0 +1,98 @@
+import time
+
+from strapper.inventory import stream
+from strapper.lazy import lazy
+from strapper.mounts import binds, mount, mounted, umount
+from strapper.plan import reserved, templates
+from strapper.scheduler import run_graph
+from strapper.snapshots import blank
+from strapper.trace import program
+
+print = lazy("rich", "print")
+
+zfs = program("zfs")
+
+
+def under(name, roots):
+    return any(name == root or name.startswith(root + "/") for root in roots)
+
+
+def select(plan, subtrees=(), tags=(), exclude=(), everything=False):
+    # The datasets of `plan' in any of `subtrees', or tagged with any of `tags', but not
+    # in any of `exclude'; dataset names may leave out the pool's. The templates users
+    # are cloned from, and the reserved space, are never selected.
+    def full(names):
+        return {
+            name if name in plan.index else plan.host + "/" + name for name in names
+        }
+
+    subtrees = full(subtrees)
+    exclude = full(exclude) | full((templates, reserved))
+    tags = set(tags)
+    return [
+        node
+        for node in plan
+        if (everything or under(node.name, subtrees) or tags.intersection(node.tags))
+        and not under(node.name, exclude)
+    ]
+
+
+def subtrees(plan, nodes, current):
+    # Groups `nodes' by the highest of them above each, along with every mount that has
+    # to come down for them to be rolled back: their own, and anything mounted under
+    # those. Groups whose mounts overlap are merged, so different groups share neither
+    # datasets nor mounts, and can be reset independently.
+    chosen = {node.name for node in nodes}
+    groups = dict()
+    root = dict()
+    for node in nodes:
+        parent = plan[node.parent].name if node.parent >= 0 else None
+        root[node.name] = root[parent] if parent in chosen else node.name
+        groups.setdefault(root[node.name], []).append(node.name)
+    merged = []
+    for datasets in groups.values():
+        members = set(datasets)
+        own = [target for [target, source] in current.items() if source in members]
+        targets = {target for target in current if under(target, own)}
+        for other in [group for group in merged if group[1] & targets]:
+            merged.remove(other)
+            datasets = other[0] + datasets
+            targets |= other[1]
+        merged.append((datasets, targets))
+    return merged
+
+
+def reset(plan, nodes, jobs=1, snapshot=blank, current=None, bound=None):
+    # Rolls each dataset back to `snapshot', destroying any later snapshots; a group's
+    # mounts are unmounted, deepest first, before any of it is rolled back, and mounted
+    # again, shallowest first, after, binds last, from wherever they were bound from.
+    # Returns the seconds each dataset took.
+    current = mounted() if current is None else current
+    bound = binds() if bound is None else bound
+    existing = set(stream(plan.host))
+    timings = dict()
+
+    def reset_subtree(group):
+        [datasets, targets] = group
+        targets = sorted(targets, key=lambda target: target.count("/"))
+        for target in reversed(targets):
+            umount(target)
+        for dataset in datasets:
+            if not dataset in existing:
+                continue
+            start = time.perf_counter()
+            zfs.rollback(dataset + "@" + snapshot, r=True)
+            timings[dataset] = time.perf_counter() - start
+            print(f"Reset {dataset} in {timings[dataset]:.3f}s")
+        for target in sorted(targets, key=lambda target: target in bound):
+            if target in bound:
+                mount(bound[target], target, bind=True)
+            elif (source := current[target]).startswith("/"):
+                mount(source, target)
+            else:
+                mount(source, target, t="zfs")
+        return datasets
+
+    groups = subtrees(plan, nodes, current)
+    run_graph(groups, [set() for _ in groups], reset_subtree, jobs=jobs)
+    return timings
@@ -0,0 +1,82 @@
+from collections import defaultdict
+
+from strapper.lazy import lazy
+from strapper.trace import tracer
+
+futures = lazy("concurrent.futures")
+
+
+def dependencies(plan):
+    # Every dataset waits on its parent and, when cloned, on the dataset it is cloned from.
+    index = plan.index
+    for node in plan:
+        depends = {node.parent} if node.parent >= 0 else set()
+        if node.origin and (
+            (origin := index.get(node.origin.partition("@")[0])) is not None
+        ):
+            depends.add(origin)
+        yield depends
+
+
+def run_graph(items, depends, task, jobs=1, skip=None):
+    # Run `task' on every item that isn't skipped, as soon as all the items it depends on
+    # have run; independent items run concurrently on up to `jobs' threads.
+    # The first error stops anything new from being started, and is re-raised once the
+    # tasks already running have finished. Returns each item's result by its index.
+    waiting = []
+    dependents = defaultdict(list)
+    for [i, dependencies] in enumerate(depends):
+        waiting.append(len(dependencies))
+        for dependency in dependencies:
+            dependents[dependency].append(i)
+    results = dict()
+    if tracer.enabled:
+        # The calls of the tasks belong to the phase they were started from.
+        phase = tracer.here()
+        untraced = task
+
+        def task(item):
+            with tracer.within(phase):
+                return untraced(item)
+
+    with futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        running = dict()
+
+        def ready(i):
+            if skip and skip(items[i]):
+                finished(i)
+            else:
+                running[executor.submit(task, items[i])] = i
+
+        def finished(i):
+            for dependent in dependents[i]:
+                waiting[dependent] -= 1
+                if not waiting[dependent]:
+                    ready(dependent)
+
+        # The roots are collected first: a skipped one finishes at once, and can bring
+        # the count of a later item down to zero before the loop gets to it.
+        for i in [i for [i, count] in enumerate(waiting) if not count]:
+            ready(i)
+        while running:
+            done, _ = futures.wait(running, return_when=futures.FIRST_EXCEPTION)
+            for future in done:
+                i = running.pop(future)
+                if error := future.exception():
+                    for other in running:
+                        other.cancel()
+                    futures.wait(running)
+                    raise error
+                results[i] = future.result()
+                finished(i)
+    return results
+
+
+def run_plan(plan, task, jobs=1, skip=None):
+    # Datasets are created once their parent, and the dataset they are cloned from, are.
+    return {
+        plan[i].name: result
+        for [i, result] in run_graph(
+            plan, list(dependencies(plan)), task, jobs=jobs, skip=skip
+        ).items()
+    }
@@ -0,0 +1,181 @@
+import os
+import socket
+import threading
+
+from pathlib import Path
+
+from strapper.compression import tuning_path
+from strapper.files import runtime_dir
+from strapper.inventory import Properties, imported
+from strapper.lazy import lazy
+from strapper.plan import compile_plan, resource_names, resources_dir, unpack_plan
+from strapper.trace import program
+
+json = lazy("orjson")
+socketserver = lazy("socketserver")
+
+zpool = program("zpool")
+
+
+def socket_path(host):
+    return runtime_dir(host + ".sock")
+
+
+def watched():
+    # The files the plan is compiled from; a change to any of them drops the plans.
+    directory = resources_dir()
+    return [directory / name for name in resource_names] + [tuning_path()]
+
+
+def stamp(paths):
+    stamps = []
+    for path in paths:
+        try:
+            status = os.stat(path)
+            stamps.append((status.st_mtime_ns, status.st_size, status.st_ino))
+        except (OSError, TypeError):
+            stamps.append(None)
+    return stamps
+
+
+class Session:
+    # What the daemon keeps warm between commands: the compiled plans, and the
+    # properties of the pool, until a client changes the pool or a resource changes.
+    def __init__(self, host):
+        self.host = host
+        self.lock = threading.Lock()
+        self.plans = dict()
+        self.properties = None
+        self.stamps = stamp(watched())
+        self.imported = False
+
+    def start(self):
+        if not imported(self.host):
+            zpool(self.host, _subcommand="import", f=True)
+            self.imported = True
+
+    def stop(self):
+        if self.imported:
+            zpool.export(self.host, f=True, _ignore_stderr=True)
+
+    def fresh(self):
+        if (stamps := stamp(watched())) != self.stamps:
+            self.stamps = stamps
+            self.plans.clear()
+
+    def handle(self, request):
+        with self.lock:
+            self.fresh()
+            if (op := request.get("op")) == "plan":
+                key = (
+                    bool(request.get("encrypted")),
+                    bool(request.get("deduplicated")),
+                )
+                if not key in self.plans:
+                    self.plans[key] = [
+                        tuple(node)
+                        for node in compile_plan(
+                            self.host, encrypted=key[0], deduplicated=key[1]
+                        )
+                    ]
+                return self.plans[key]
+            if op == "properties":
+                if self.properties is None:
+                    self.properties = Properties.load(self.host)
+                return dict(
+                    datasets=self.properties.datasets, pool=self.properties.pool
+                )
+            if op == "invalidate":
+                # Read them again straight away, so that the next command finds them warm.
+                self.properties = None
+                threading.Thread(
+                    target=self.handle, args=(dict(op="properties"),)
+                ).start()
+                return True
+            if op == "status":
+                return dict(host=self.host, pid=os.getpid(), imported=self.imported)
+            raise ValueError(f"Sorry; `{op}' isn't something a session can do!")
+
+
+def serve(host, path=None):
+    # Runs the session daemon in the foreground until a client asks it to stop.
+    path = Path(path or socket_path(host))
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    path.unlink(missing_ok=True)
+    session = Session(host)
+    session.start()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                request = json.loads(line)
+                if request.get("op") == "stop":
+                    self.wfile.write(json.dumps(dict(result=True)) + b"\n")
+                    threading.Thread(target=server.shutdown).start()
+                    return
+                try:
+                    response = dict(result=session.handle(request))
+                except Exception as error:
+                    response = dict(error=str(error))
+                self.wfile.write(json.dumps(response) + b"\n")
+
+    try:
+        with socketserver.ThreadingUnixStreamServer(str(path), Handler) as server:
+            # Clients keep their connection for as long as their command runs.
+            server.daemon_threads = True
+            os.chmod(path, 0o600)
+            server.serve_forever()
+    finally:
+        path.unlink(missing_ok=True)
+        session.stop()
+
+
+class Client:
+    # Talks to a running session daemon over its socket; `connect' returns `None' when
+    # there is no daemon for the host, so that commands can fall back to doing the work.
+    __slots__ = ("host", "file", "sock")
+
+    def __init__(self, host, sock):
+        self.host = host
+        self.sock = sock
+        self.file = sock.makefile("rwb")
+
+    @classmethod
+    def connect(cls, host, path=None):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(path or socket_path(host)))
+        except OSError:
+            sock.close()
+            return None
+        return cls(host, sock)
+
+    def request(self, op, **kwargs):
+        self.file.write(json.dumps(dict(op=op, **kwargs)) + b"\n")
+        self.file.flush()
+        response = json.loads(self.file.readline())
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    def plan(self, encrypted=False, deduplicated=False):
+        return unpack_plan(
+            self.host,
+            self.request("plan", encrypted=encrypted, deduplicated=deduplicated),
+        )
+
+    def properties(self):
+        return Properties(**self.request("properties"))
+
+    def invalidate(self):
+        return self.request("invalidate")
+
+    def status(self):
+        return self.request("status")
+
+    def stop(self):
+        return self.request("stop")
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
@@ -0,0 +1,54 @@
+import os
+
+from collections import defaultdict
+
+from strapper.trace import program
+
+zfs = program("zfs")
+
+blank = "blank"
+
+
+def argument_limit():
+    # Leave half of the limit for the environment and the rest of the command line.
+    try:
+        return os.sysconf("SC_ARG_MAX") // 2
+    except (ValueError, OSError):
+        return 2**16
+
+
+def chunk_arguments(arguments, limit=None):
+    limit = limit or argument_limit()
+    chunk = []
+    size = 0
+    for argument in arguments:
+        length = len(os.fsencode(argument)) + 1
+        if chunk and (size + length > limit):
+            yield chunk
+            chunk = []
+            size = 0
+        chunk.append(argument)
+        size += length
+    if chunk:
+        yield chunk
+
+
+def origins(plan):
+    # dataset -> the snapshots of it that datasets of `plan' are cloned from
+    snapshots = defaultdict(set)
+    for node in plan:
+        if node.origin:
+            [dataset, snapshot] = node.origin.split("@")
+            snapshots[dataset].add(snapshot)
+    return snapshots
+
+
+def snapshot_and_hold(datasets, snapshot=blank, limit=None):
+    # `zfs snapshot' takes every snapshot given to it in a single transaction,
+    # so each chunk of datasets is snapshotted, and then held, atomically.
+    snapshots = [dataset + "@" + snapshot for dataset in datasets]
+    for chunk in chunk_arguments(snapshots, limit):
+        zfs.snapshot(*chunk)
+    for chunk in chunk_arguments(snapshots, limit):
+        zfs.hold(snapshot, *chunk)
+    return snapshots
@@ -0,0 +1,127 @@
+import time
+
+from pathlib import Path
+
+from strapper.files import cache_dir, write_atomic
+from strapper.lazy import lazy
+from strapper.scheduler import run_graph
+from strapper.trace import tracer
+
+json = lazy("orjson")
+
+
+class Stage:
+    # A step of a command, run once every stage making any of its `inputs' has run; an
+    # input no stage makes, such as one of a stage left out, is there from the start.
+    __slots__ = ("name", "run", "inputs", "outputs")
+
+    def __init__(self, name, run, inputs=(), outputs=()):
+        self.name = name
+        self.run = run
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+
+
+def dependencies(stages):
+    makers = dict()
+    for [i, stage] in enumerate(stages):
+        for output in stage.outputs:
+            makers[output] = i
+    return [
+        {makers[name] for name in stage.inputs if name in makers} for stage in stages
+    ]
+
+
+def timings_path():
+    return cache_dir("stages.json")
+
+
+def load_timings(command, path=None):
+    # stage -> the seconds it took the last time `command' ran it
+    try:
+        return json.loads(Path(path or timings_path()).read_bytes()).get(command, {})
+    except (OSError, ValueError, AttributeError):
+        return dict()
+
+
+def save_timings(command, timings, path=None):
+    path = Path(path or timings_path())
+    try:
+        everything = json.loads(path.read_bytes())
+    except (OSError, ValueError):
+        everything = dict()
+    everything[command] = everything.get(command, {}) | timings
+    write_atomic(path, json.dumps(everything, option=json.OPT_SORT_KEYS))
+
+
+def critical_path(stages, timings):
+    # The chain of stages that takes longest, by their last timings, and then by the
+    # number of stages, for the ones never timed; no amount of concurrency beats it.
+    depends = dependencies(stages)
+    longest = dict()
+
+    def visit(i):
+        if not i in longest:
+            [seconds, count, path] = max(
+                (visit(j) for j in depends[i]), default=(0.0, 0, ())
+            )
+            longest[i] = (
+                seconds + timings.get(stages[i].name, 0.0),
+                count + 1,
+                path + (i,),
+            )
+        return longest[i]
+
+    [seconds, _, path] = max(
+        (visit(i) for i in range(len(stages))), default=(0.0, 0, ())
+    )
+    return seconds, [stages[i].name for i in path]
+
+
+def render(stages, timings):
+    depends = dependencies(stages)
+    [seconds, path] = critical_path(stages, timings)
+    width = max((len(stage.name) for stage in stages), default=0)
+    lines = ["Stages, with `*' on the critical path:"]
+    for [stage, needs] in zip(stages, depends):
+        taken = timings.get(stage.name)
+        lines.append(
+            f"\t{'*' if stage.name in path else ' '} {stage.name:<{width}}"
+            f"\t{'' if taken is None else f'{taken:9.3f}s'}"
+            f"\tafter: {', '.join(stages[i].name for i in sorted(needs)) or '-'}"
+        )
+    lines.append(
+        f"Critical path: {' -> '.join(path)}"
+        + (f" ({seconds:.3f}s last time)" if seconds else "")
+    )
+    return "\n".join(lines)
+
+
+def run_stages(command, stages, sequential=False, on_error=None):
+    # Runs every stage as soon as its inputs are made, each in a phase of its own, and
+    # remembers how long each took for the critical path of later runs; `on_error' is
+    # called as soon as a stage fails, to stop the ones still running early.
+    def run(stage):
+        start = time.perf_counter()
+        try:
+            with tracer.phase(stage.name):
+                stage.run()
+        except BaseException:
+            if on_error:
+                on_error()
+            raise
+        return time.perf_counter() - start
+
+    results = run_graph(
+        stages,
+        dependencies(stages),
+        run,
+        jobs=1 if sequential else len(stages),
+    )
+    timings = {stages[i].name: seconds for [i, seconds] in results.items()}
+    if not sequential:
+        try:
+            save_timings(command, timings)
+        except OSError:
+            pass
+    return timings
@@ -0,0 +1,290 @@
+import os
+import stat
+import time
+
+from pathlib import Path
+
+from strapper.files import cache_dir
+from strapper.inventory import run_query
+from strapper.lazy import lazy
+from strapper.scheduler import run_graph
+from strapper.snapshots import chunk_arguments
+from strapper.sync import copy_data, walk
+from strapper.trace import tracer
+
+json = lazy("orjson")
+shutil = lazy("shutil")
+subprocess = lazy("subprocess")
+
+store_dir = "/nix/store"
+
+
+def log_path(host):
+    return cache_dir("builds", host + ".log")
+
+
+def system_expression(resources, host):
+    # The system `main' points configuration.nix at, taken straight from the resources.
+    return f'(import "{Path(resources).absolute()}").nixosConfigurations.${{builtins.currentSystem}}.mini-{host}.config.system.build.toplevel'
+
+
+class Build:
+    # Builds the system in the background, needing neither the pool nor anything mounted,
+    # while the disks are provisioned; its log goes to the cache instead of the terminal.
+    __slots__ = ("argv", "log", "process", "start")
+
+    def __init__(self, resources, host):
+        self.argv = self.command(resources, host)
+        self.log = log_path(host)
+        self.log.parent.mkdir(parents=True, exist_ok=True)
+        self.start = time.perf_counter_ns()
+        with open(self.log, "wb") as log:
+            self.process = subprocess.Popen(
+                self.argv, stdout=subprocess.PIPE, stderr=log, text=True
+            )
+
+    @staticmethod
+    def command(resources, host):
+        return [
+            "nix-build",
+            "--no-out-link",
+            "--show-trace",
+            "--option",
+            "build-fallback",
+            "true",
+            "-E",
+            system_expression(resources, host),
+        ]
+
+    def wait(self):
+        # The path of the built system, or `None' if the build failed.
+        output = self.process.communicate()[0]
+        if tracer.enabled:
+            tracer.record(
+                self.argv,
+                self.start,
+                time.perf_counter_ns(),
+                self.process.returncode,
+                len(output),
+            )
+        if self.process.returncode or not (paths := output.split()):
+            return None
+        return paths[-1]
+
+    def cancel(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+
+
+class Report:
+    __slots__ = ("system", "paths", "bytes", "present", "kept", "total")
+
+    def __init__(self, system=None):
+        self.system = system
+        self.paths = 0
+        self.bytes = 0
+        self.present = 0
+        self.kept = 0
+        self.total = None
+
+    def __str__(self):
+        if self.system is None:
+            return "Couldn't evaluate the system, so there was nothing to seed the store with."
+        seeded = f"Seeded {self.paths} store paths ({self.bytes} bytes) from the live store, and found {self.present} already there."
+        if self.total is None:
+            return seeded
+        fetched = max(0, self.total - self.bytes - self.kept)
+        return f"{seeded} Of the {self.total} bytes the system needs, {self.bytes + self.kept} were reused and {fetched} fetched or built."
+
+
+def flake_argument(args):
+    # The value of `--flake' among the arguments passed on to `nixos-install', if any.
+    args = iter(args)
+    for arg in args:
+        if arg == "--flake":
+            return next(args, None)
+        if arg.startswith("--flake="):
+            return arg.partition("=")[2]
+    return None
+
+
+def system_derivation(args, root="/mnt"):
+    # The derivation of the system `nixos-install' will build, evaluated the same way:
+    # from the flake it is given, or else from the configuration under `root'.
+    if flake := flake_argument(args):
+        [uri, _, name] = flake.partition("#")
+        argv = [
+            "nix",
+            "--extra-experimental-features",
+            "nix-command flakes",
+            "eval",
+            "--raw",
+            f'{uri}#nixosConfigurations."{name or os.uname().nodename}".config.system.build.toplevel.drvPath',
+        ]
+    else:
+        argv = [
+            "nix-instantiate",
+            "<nixpkgs/nixos>",
+            "-A",
+            "system",
+            "-I",
+            f"nixos-config={root}/etc/nixos/configuration.nix",
+        ]
+    process = run_query(argv)
+    if process.returncode or not (lines := process.stdout.split()):
+        return None
+    return lines[-1]
+
+
+def closure(derivation):
+    # Every path of the system's closure that is already in the live store: the outputs
+    # of its derivations built here before, and everything they refer to.
+    process = run_query(["nix-store", "-q", "-R", "--include-outputs", derivation])
+    return [
+        path
+        for path in process.stdout.split()
+        if not path.endswith(".drv") and os.path.lexists(path)
+    ]
+
+
+def outputs(derivation):
+    return run_query(["nix-store", "-q", "--outputs", derivation]).stdout.split()
+
+
+def nar_sizes(paths, store=None):
+    # path -> the size of its serialisation, which is what Nix counts when it copies.
+    sizes = dict()
+    for chunk in chunk_arguments(paths):
+        process = run_query(
+            [
+                "nix",
+                "--extra-experimental-features",
+                "nix-command",
+                "path-info",
+                "--json",
+                *(("--store", store) if store else ()),
+                *chunk,
+            ]
+        )
+        try:
+            info = json.loads(process.stdout or "[]")
+        except ValueError:
+            continue
+        # Older versions of Nix print a list of paths, and newer ones an object of them.
+        for [path, entry] in (
+            info.items()
+            if isinstance(info, dict)
+            else ((entry.get("path"), entry) for entry in info)
+        ):
+            if entry and "narSize" in entry:
+                sizes[path] = entry["narSize"]
+    return sizes
+
+
+def copy_entry(source, destination, status):
+    if stat.S_ISLNK(status.st_mode):
+        os.symlink(os.readlink(source), destination)
+    elif stat.S_ISDIR(status.st_mode):
+        os.mkdir(destination, 0o755)
+    else:
+        with open(source, "rb") as s, open(destination, "wb") as d:
+            copy_data(s, d)
+        os.chmod(destination, stat.S_IMODE(status.st_mode))
+        os.utime(destination, ns=(status.st_atime_ns, status.st_mtime_ns))
+        return status.st_size
+    return 0
+
+
+def copy_path(path, root):
+    # Copies one store path, a file, a symlink or a directory, under a temporary name
+    # and renames it into place, so an interrupted seed never leaves half a path behind.
+    # Directories stay writable until everything is in them, and get their modes last.
+    target = Path(root + path)
+    temporary = target.with_name(f".{target.name}.{os.getpid()}.seed")
+    status = os.lstat(path)
+    directories = []
+    try:
+        copied = copy_entry(path, temporary, status)
+        if stat.S_ISDIR(status.st_mode):
+            directories.append((temporary, status))
+            for [relative, entry] in walk(path):
+                status = entry.stat(follow_symlinks=False)
+                copied += copy_entry(entry.path, temporary / relative, status)
+                if stat.S_ISDIR(status.st_mode):
+                    directories.append((temporary / relative, status))
+        for [directory, status] in reversed(directories):
+            os.chmod(directory, stat.S_IMODE(status.st_mode))
+            os.utime(directory, ns=(status.st_atime_ns, status.st_mtime_ns))
+        os.rename(temporary, target)
+    except BaseException:
+        if temporary.is_dir() and not temporary.is_symlink():
+            for [directory, _] in directories:
+                os.chmod(directory, 0o755)
+            shutil.rmtree(temporary, ignore_errors=True)
+        elif os.path.lexists(temporary):
+            temporary.unlink()
+        raise
+    return copied
+
+
+def register(paths, root):
+    # Copies the live store's database entries for `paths' into the target's, the way
+    # `nix-store --dump-db | nix-store --load-db' does, so that Nix there treats them as
+    # valid instead of fetching or building them again.
+    for chunk in chunk_arguments(paths):
+        start = time.perf_counter_ns()
+        dump = subprocess.run(
+            ["nix-store", "--dump-db", *chunk], stdout=subprocess.PIPE, check=True
+        ).stdout
+        argv = ["nix-store", "--store", root, "--load-db"]
+        process = subprocess.run(argv, input=dump)
+        if tracer.enabled:
+            tracer.record(
+                argv, start, time.perf_counter_ns(), process.returncode, len(dump)
+            )
+        process.check_returncode()
+
+
+def seed(args, root="/mnt", jobs=4, dry_run=False, system=None):
+    # Copies every path of the system's closure that the live store already has, and the
+    # target's doesn't, into the target's store, `jobs' paths at a time, and registers
+    # them there; `system' is the system already built, if it was. Returns a report of
+    # what was reused.
+    report = Report(system or system_derivation(args, root))
+    if report.system is None:
+        return report
+    paths = closure(report.system)
+    store = Path(root + store_dir)
+    missing = [path for path in paths if not os.path.lexists(root + path)]
+    sizes = nar_sizes(paths)
+    report.paths = len(missing)
+    report.bytes = sum(sizes.get(path, 0) for path in missing)
+    report.present = len(paths) - len(missing)
+    report.kept = sum(sizes.values()) - report.bytes
+    if dry_run or not paths:
+        return report
+    if not store.exists():
+        store.mkdir(parents=True)
+        os.chmod(store, 0o1775)
+    run_graph(
+        missing,
+        [set() for _ in missing],
+        lambda path: copy_path(path, root),
+        jobs=jobs,
+    )
+    register(paths, root)
+    return report
+
+
+def account(report, root="/mnt"):
+    # After `nixos-install', the size of the whole installed closure, so that the report
+    # can tell what was fetched or built from what was reused.
+    if report.system is None:
+        return report
+    if systems := [
+        path for path in outputs(report.system) if os.path.lexists(root + path)
+    ]:
+        process = run_query(["nix-store", "--store", root, "-q", "-R", *systems])
+        report.total = sum(nar_sizes(process.stdout.split(), store=root).values())
+    return report
@@ -1,43 +1,81 @@
-import rich.traceback
-
-rich.traceback.install(show_locals=True)
-
 import oreo
-import orjson as json
 import os
-import yaml
-
-from addict import Dict
-from bakery import (
-    getconf,
-    mkswap,
-    mount,
-    nix,
-    nixos_generate_config,
-    nixos_install,
-    nixos_rebuild,
-    parted,
-    rsync,
-    sd,
-    swapon,
-    umount,
-    zfs,
-    zpool,
-)
+import time
+
+from collections import defaultdict
 from functools import partial
-from importlib.resources import files
 from pathlib import Path
-from rich.prompt import Prompt
-from rich import print
 
-import click
+from strapper.lazy import lazy
+from strapper.trace import program, tracer
+
+Dict = lazy("addict", "Dict")
+Prompt = lazy("rich.prompt", "Prompt")
+print = lazy("rich", "print")
+rich_traceback = lazy("rich.traceback")
+
+getconf = program("getconf")
+mkswap = program("mkswap")
+mount = program("mount")
+nix = program("nix")
+nixos_generate_config = program("nixos_generate_config")
+nixos_install = program("nixos_install")
+nixos_rebuild = program("nixos_rebuild")
+sd = program("sd")
+swapon = program("swapon")
+umount = program("umount")
+zfs = program("zfs")
+zpool = program("zpool")
 
-# Adapted From:
-# Answer: https://stackoverflow.com/a/58941536/10827766
-# User: https://stackoverflow.com/users/674039/wim
-strapper_resources = files("strapper.resources")
+# The features are only imported once a command uses them, so that `strapper --help'
+# never waits on them, or on what they import in turn.
+codecs = lazy("strapper.compression", "codecs")
+load_tuning = lazy("strapper.compression", "load_tuning")
+measure = lazy("strapper.compression", "measure")
+recommend = lazy("strapper.compression", "recommend")
+recordsize = lazy("strapper.compression", "recordsize")
+sample_blocks = lazy("strapper.compression", "sample_blocks")
+save_tuning = lazy("strapper.compression", "save_tuning")
+Sketch = lazy("strapper.dedup", "Sketch")
+estimate = lazy("strapper.dedup", "estimate")
+diff_plan = lazy("strapper.diff", "diff_plan")
+write_if_changed = lazy("strapper.files", "write_if_changed")
+Properties = lazy("strapper.inventory", "Properties")
+imported = lazy("strapper.inventory", "imported")
+parse_size = lazy("strapper.inventory", "parse_size")
+mount_all = lazy("strapper.mounts", "mount_all")
+mount_plan = lazy("strapper.mounts", "mount_plan")
+system_root = lazy("strapper.mounts", "system_root")
+ashift = lazy("strapper.partitions", "ashift")
+boot_commands = lazy("strapper.partitions", "boot_commands")
+format_boot = lazy("strapper.partitions", "format_boot")
+format_swap = lazy("strapper.partitions", "format_swap")
+layout = lazy("strapper.partitions", "layout")
+partition_disks = lazy("strapper.partitions", "partition_disks")
+partlabel = lazy("strapper.partitions", "partlabel")
+swap_commands = lazy("strapper.partitions", "swap_commands")
+compile_plan = lazy("strapper.plan", "compile_plan")
+reset_datasets = lazy("strapper.reset", "reset")
+select = lazy("strapper.reset", "select")
+run_plan = lazy("strapper.scheduler", "run_plan")
+Client = lazy("strapper.session", "Client")
+serve = lazy("strapper.session", "serve")
+origins = lazy("strapper.snapshots", "origins")
+snapshot_and_hold = lazy("strapper.snapshots", "snapshot_and_hold")
+Stage = lazy("strapper.stages", "Stage")
+load_timings = lazy("strapper.stages", "load_timings")
+render = lazy("strapper.stages", "render")
+run_stages = lazy("strapper.stages", "run_stages")
+Build = lazy("strapper.store", "Build")
+account = lazy("strapper.store", "account")
+seed_store = lazy("strapper.store", "seed")
+sync_tree = lazy("strapper.sync", "sync_tree")
+wipe_devices = lazy("strapper.wipe", "wipe_devices")
+
+import click
 
 
+@tracer.phase("dataset tree")
 def update_datasets(
     ctx,
     swap=0,
@@ -46,159 +84,123 @@ def update_datasets(
     pool=False,
     root_device=None,
     reserved_only=False,
+    jobs=1,
+    plan_only=False,
 ):
+    from strapper.plan import reserved
+
     host = ctx.obj.host
     resources = ctx.obj.resources
-    snap_dir = ["snapdir=visible"]
-    extra_copies = snap_dir + ["copies=3"]
-    cache = ["sync=disabled"]
-    reserved = "reserved"
-    datasets = Dict(
-        yaml.safe_load((strapper_resources / "datasets.yaml").read_text().strip())
-    )
-    datasets |= yaml.safe_load(
-        (strapper_resources / "user_datasets.yaml").read_text().strip()
-    )
-    primary_user = (strapper_resources / "username.txt").read_text().strip()
-    users = Dict(json.loads((strapper_resources / "users.json").read_text().strip()))
-    homes = Dict(json.loads((strapper_resources / "homes.json").read_text().strip()))
-    datasets[host].datasets.jails.datasets.base = (dict(),)
-    datasets[host].options = ["mountpoint=legacy"]
-    for user in users.values():
-        datasets.system.datasets.home.datasets[user] = dict()
-        datasets.system.datasets.persist.datasets[user] = dict()
-        datasets.virt.datasets.podman.datasets[user] = dict()
+    # Whether the pool changed, and so the session daemon's copy of its properties with it.
+    touched = reserved_only
+    session = ctx.obj.session
+    if pool or reserved_only:
+        properties = session.properties() if session else Properties.load(host)
+        refreservation = str(properties.pool_bytes() * 15 // 100)
+        if not reserved_only and swap:
+            check_swap(host, swap, properties, refreservation)
     if reserved_only:
         zfs.create(host + "/" + reserved, o="mountpoint=none")
     else:
-        with open(resources + "/datasets.nix", "w") as dnix:
-            dnix.write(
-                "".join(
-                    (
-                        'host: { \n\t"',
-                        (root_device or "${host}/system/root"),
-                        '" = "/";\n',
-                    )
-                )
-            )
+        plan = current_plan(ctx, encrypted=encrypted, deduplicated=deduplicated)
+        if pool:
+            inventory = properties.inventory()
+            changes = diff_plan(plan, inventory, properties, ignore=(host + "/swap",))
+            if plan_only:
+                print(changes.render())
+                return
+        write_if_changed(Path(resources, "datasets.nix"), plan.render(root_device))
+        if pool:
+            missing = {node.name for node in changes.create}
+            cloned = origins(plan)
 
-            def recurse(ddict, dname, droot, mountpoint=""):
-                _datasets = zfs.list(
-                    r=True,
-                    o="name",
-                    _list=True,
-                    _ignore_stderr=True,
+            def create_dataset(node):
+                zfs(
+                    node.origin or "",
+                    node.name,
+                    _subcommand="clone" if node.origin else "create",
+                    o={"repeat-with-values": node.options},
                 )
-                _datasets = _datasets[2 : len(_datasets)]
-                _dataset = droot + "/" + dname
-                _real_dataset = _dataset.replace("${host}", host)
-                cloning = dname != "base" and (encrypted and deduplicated)
-                prefixes = (
-                    "system",
-                    "system/root",
-                    "swap",
-                    "base",
-                    "omniverse",
-                    reserved,
-                )
-                if cloning:
-                    clone_or_create = "clone"
-                    snapshot_or_none = host + "/base@root"
-                else:
-                    clone_or_create = "create"
-                    snapshot_or_none = ""
-                if not _real_dataset in [host + "/" + prefix for prefix in prefixes]:
-                    if _mountpoint := ddict.get("mountpoint", ""):
-                        mountpoint = _mountpoint
-                    else:
-                        if mountpoint:
-                            mountpoint = mountpoint + "/" + dname
-                            _mountpoint = mountpoint
-                        else:
-                            _mountpoint = _dataset.removeprefix("${host}" + "/")
-                            for prefix in prefixes:
-                                _mountpoint = _mountpoint.removeprefix(prefix + "/")
-                            _mountpoint = "/" + _mountpoint
-                    if _real_dataset.startswith(
-                        host_user := host + "/" + primary_user
-                    ) and (not (_real_dataset == host_user)):
-                        dnix.write(
-                            "".join(
-                                (
-                                    '\t"',
-                                    _dataset,
-                                    '" = [ ',
-                                    " ".join(
-                                        (
-                                            '"' + homes[user] + "/" + dname + '"'
-                                            for user in users.keys()
-                                        )
-                                    ),
-                                    " ];\n",
-                                )
-                            )
-                        )
-
-                    # TODO: What does this do? Mind that this sits in the middle of an if statement.
-                    # else:
-                    #     for user in users.keys():
-                    #         dnix.write(
-                    #             "".join(
-                    #                 '\t"',
-                    #                 _dataset,
-                    #                 '" = "',
-                    #                 homes[user] + "/" + dname,
-                    #                 '";\n',
-                    #             )
-                    #         )
-
-                    else:
-                        dnix.write(
-                            "".join('\t"', _dataset, '" = "', _mountpoint, '";\n')
-                        )
-                if pool and (not _real_dataset in _datasets):
-                    zfs(
-                        snapshot_or_none,
-                        _real_dataset,
-                        _subcommand=clone_or_create,
-                        o={"repeat-with-values": ddict.get("options", [])},
+                # Anything cloned from this dataset waits on it, and so on its snapshots.
+                if snapshots := cloned.get(node.name):
+                    zfs.snapshot(
+                        *(node.name + "@" + snapshot for snapshot in sorted(snapshots))
                     )
-                    zfs.snapshot(_real_dataset + "@blank", r=True)
-                    zfs.hold("blank", _real_dataset + "@blank", r=True)
-                for [key, value] in ddict.get("datasets", Dict()).items():
-                    recurse(value, key, _dataset, mountpoint)
-
-            for [key, value] in datasets.items():
-                recurse(value, key, "${host}")
-            dnix.write("}")
+                inventory.add(node.name)
+                return node.name
+
+            created = run_plan(
+                plan,
+                create_dataset,
+                jobs=jobs,
+                skip=lambda node: not node.name in missing,
+            )
+            snapshot_and_hold(node.name for node in plan if node.name in created)
+            for [dataset, prop, value, _] in changes.set:
+                zfs.set(prop + "=" + value, dataset)
+            touched = bool(changes)
     if pool or reserved_only:
-        pool_size_plus_metric = zpool.get(
-            "size", host, H=True, _list=True, _split=True
-        )[2]
-        pool_size = round(float(pool_size_plus_metric[0:-1]), 2)
-        pool_metric = pool_size_plus_metric[-1]
+        if properties.get(host + "/" + reserved, "refreservation") != refreservation:
+            zfs.set("refreservation=" + refreservation, host + "/" + reserved)
+            touched = True
+        if not reserved_only and swap:
+            create_swap(host, swap)
+            touched = True
+        if session and touched:
+            session.invalidate()
 
-        def pool_percentage_value(percentage):
-            return str(round(float(percentage) / 100, 2)) + pool_metric
 
-        zfs.set("refreservation=" + pool_percentage_value(15), host + "/" + reserved)
-        if not reserved_only and swap:
-            swoptions = [
-                "com.sun:auto-snapshot=false",
-                "compression=zle",
-                "logbias=throughput",
-                "primarycache=metadata",
-                "secondarycache=none",
-                "sync=standard",
-            ]
-            page_size = getconf("PAGESIZE", _str=True)
-            zfs.create(
-                host + "/swap",
-                V=str(swap) + "G",
-                b=page_size,
-                o={"repeat-with-values": swoptions},
-            )
-            mkswap("/dev/zvol" + host + "/swap")
+def check_swap(host, swap, properties, refreservation):
+    # Before anything changes: whether a `swap' GiB volume fits in what will be free once
+    # the reserved space has its `refreservation'.
+    from strapper.plan import reserved
+
+    current = properties.get(host + "/" + reserved, "refreservation")
+    free = properties.pool_bytes("free") - max(
+        0, int(refreservation) - (int(current) if str(current).isdigit() else 0)
+    )
+    if swap * 1024**3 > free:
+        raise click.UsageError(
+            f"Sorry; a {swap}G swap volume won't fit in the {max(0, free)} bytes free on {host} once {refreservation} are reserved!"
+        )
+
+
+def create_swap(host, swap):
+    swap_bytes = swap * 1024**3
+    swoptions = [
+        "com.sun:auto-snapshot=false",
+        "compression=zle",
+        "logbias=throughput",
+        "primarycache=metadata",
+        "secondarycache=none",
+        "sync=standard",
+    ]
+    page_size = getconf("PAGESIZE", _str=True)
+    zfs.create(
+        host + "/swap",
+        V=str(swap_bytes),
+        b=page_size,
+        o={"repeat-with-values": swoptions},
+    )
+    mkswap("/dev/zvol/" + host + "/swap")
+
+
+def current_plan(ctx, encrypted=False, deduplicated=False):
+    # From the session daemon when one is running, which keeps it compiled.
+    if ctx.obj.session:
+        return ctx.obj.session.plan(encrypted=encrypted, deduplicated=deduplicated)
+    return compile_plan(ctx.obj.host, encrypted=encrypted, deduplicated=deduplicated)
+
+
+def export_pool(ctx):
+    # A running session daemon keeps the pool imported for the commands that follow.
+    if not ctx.obj.session:
+        zpool.export(ctx.obj.host, f=True, _ignore_stderr=True)
+
+
+def write_trace(path):
+    tracer.write(path)
+    print(tracer.summary())
 
 
 @click.group(no_args_is_help=True)
@@ -208,8 +210,18 @@ def update_datasets(
 @click.option("-P", "--print-run", is_flag=True, cls=oreo.Option, xor=["print"])
 @click.option("-p", "--print", is_flag=True, cls=oreo.Option, xor=["print-run"])
 @click.option("-r", "--resources-dir")
+@click.option(
+    "-t",
+    "--trace",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the timings of every command run as a Chrome trace to this file, and summarize them",
+)
 @click.pass_context
-def strapper(ctx, dazzle, host, inspect, print_run, print, resources_dir):
+def strapper(ctx, dazzle, host, inspect, print_run, print, resources_dir, trace):
+    rich_traceback.install(show_locals=True)
+    if trace:
+        tracer.enable()
+        ctx.call_on_close(partial(write_trace, trace))
     if os.geteuid() != 0:
         raise SystemError("Sorry; this program needs to be run as root!")
     ctx.ensure_object(dict)
@@ -233,6 +245,9 @@ def strapper(ctx, dazzle, host, inspect, print_run, print, resources_dir):
                 ):
                     ctx.obj.resources = mnt_dir
     ctx.obj.host = host
+    if session := Client.connect(host):
+        ctx.call_on_close(session.close)
+    ctx.obj.session = session
     return getconf.bake_all_(
         _dazzle=dazzle,
         _print_command_and_run=print_run,
@@ -248,6 +263,12 @@ def strapper(ctx, dazzle, host, inspect, print_run, print, resources_dir):
 @click.argument("program-arguments", nargs=-1)
 @click.option("-a", "--all", is_flag=True)
 @click.option("-c", "--copy", is_flag=True)
+@click.option(
+    "-D",
+    "--delete",
+    is_flag=True,
+    help="When copying, also delete the files copied by previous runs that are gone from the resources directory",
+)
 @click.option("-g", "--generate", is_flag=True)
 @click.option("-i", "--install", is_flag=True)
 @click.option(
@@ -257,51 +278,77 @@ def strapper(ctx, dazzle, host, inspect, print_run, print, resources_dir):
     cls=oreo.Option,
     req_one_of=["install", "all"],
 )
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    help="The number of store paths to seed at once",
+)
 @click.option("-r", "--replace", is_flag=True)
 @click.option("-R", "--rebuild")
+@click.option(
+    "-s",
+    "--seed",
+    is_flag=True,
+    cls=oreo.Option,
+    req_one_of=["install", "all"],
+    help="Before installing, copy whatever the system needs that is already in this machine's store into /mnt/nix/store",
+)
+@click.option(
+    "-S",
+    "--system",
+    cls=oreo.Option,
+    req_one_of=["install", "all"],
+    help="Install this system, already built, instead of building it",
+)
 @click.pass_context
 def main(
     ctx,
     all,
     copy,
+    delete,
     generate,
     install,
+    jobs,
     program_arguments,
     rebuild,
     replace,
+    seed,
+    system,
     install_bootloader,
 ):
     getconf.bake_all_(_sudo=True, _run=True)
-    copy_partial = partial(
-        rsync,
-        f"{ctx.obj.resources}/",
-        a=True,
-        v={"repeat": 2},
-        c=True,
-        z={"repeat": 2},
-    )
+
+    def copy_partial(destination):
+        print(sync_tree(ctx.obj.resources, destination, delete=delete))
+
     if rebuild:
-        if copy:
-            copy_partial("/etc/nixos/")
-        nixos_rebuild(rebuild, *ctx.args, show_trace=True)
+        with tracer.phase("copy"):
+            if copy:
+                copy_partial("/etc/nixos/")
+        with tracer.phase("rebuild"):
+            nixos_rebuild(rebuild, *ctx.args, show_trace=True)
     else:
         if copy or all:
             update_datasets(ctx)
-            copy_partial("/mnt/etc/nixos/")
-        if generate or all:
-            nixos_generate_config(root="/mnt")
-        if replace or all:
-            sd(
-                "./hardware-configuration.nix",
-                "(import ./.).nixosConfigurations.${pkgs.stdenv.targetPlatform.system}.mini-"
-                + ctx.obj.host,
-                "/mnt/etc/nixos/configuration.nix",
-            )
-            sd(
-                "'device = \"\"'",
-                "'device = \"!\"'",
-                "/mnt/etc/nixos/hardware-configuration.nix",
-            )
+            with tracer.phase("copy"):
+                copy_partial("/mnt/etc/nixos/")
+        with tracer.phase("generate"):
+            if generate or all:
+                nixos_generate_config(root="/mnt")
+            if replace or all:
+                sd(
+                    "./hardware-configuration.nix",
+                    "(import ./.).nixosConfigurations.${pkgs.stdenv.targetPlatform.system}.mini-"
+                    + ctx.obj.host,
+                    "/mnt/etc/nixos/configuration.nix",
+                )
+                sd(
+                    "'device = \"\"'",
+                    "'device = \"!\"'",
+                    "/mnt/etc/nixos/hardware-configuration.nix",
+                )
         if install or all:
             options = [
                 # Adapted From: https://github.com/NixOS/nix/issues/2293#issuecomment-405339738
@@ -314,17 +361,32 @@ def main(
                 # Adapted From: https://github.com/NixOS/nix/issues/807#issuecomment-209895935
                 "build-fallback true",
             ]
-            nixos_install(
-                *ctx.args,
-                # Because I'm using the flakes nixosConfigurations output, I don't need this anymore:
-                # :I (with [f (.open (+ ctx.obj.resources "/flake.lock"))]
-                # #[f[nixpkgs=https://github.com/nixos/nixpkgs/archive/{(get (.load json f) "nodes" "22-11" "original" "ref")}.tar.gz]f])
-                # I=f"""nixpkgs={nix.eval(impure=True, expr='(import ./etc/nixos).inputs.nixpkgs.outPath', _run=False).strip('"')}""",
-                _run=True,
-                show_trace=True,
-                install_bootloader=install_bootloader,
-                option={"repeat-with-values": options},
-            )
+            report = None
+            if seed:
+                with tracer.phase("seed"):
+                    report = seed_store(
+                        ctx.args,
+                        "/mnt",
+                        jobs=jobs,
+                        dry_run=ctx.find_root().params["print"],
+                        system=system,
+                    )
+                    print(report)
+            with tracer.phase("install"):
+                nixos_install(
+                    *ctx.args,
+                    # Because I'm using the flakes nixosConfigurations output, I don't need this anymore:
+                    # :I (with [f (.open (+ ctx.obj.resources "/flake.lock"))]
+                    # #[f[nixpkgs=https://github.com/nixos/nixpkgs/archive/{(get (.load json f) "nodes" "22-11" "original" "ref")}.tar.gz]f])
+                    # I=f"""nixpkgs={nix.eval(impure=True, expr='(import ./etc/nixos).inputs.nixpkgs.outPath', _run=False).strip('"')}""",
+                    _run=True,
+                    show_trace=True,
+                    install_bootloader=install_bootloader,
+                    option={"repeat-with-values": options},
+                    **(dict(system=system) if system else dict()),
+                )
+            if report:
+                print(account(report, "/mnt"))
 
 
 @strapper.command(no_args_is_help=True)
@@ -332,6 +394,25 @@ def main(
 @click.option("-c", "--copies", type=int, default=1)
 @click.option("-d", "--deduplicated", is_flag=True)
 @click.option("-e", "--encrypted", is_flag=True)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    help="The number of datasets to create at once",
+)
+@click.option(
+    "-i",
+    "--install",
+    is_flag=True,
+    help="Then mount the pool and install the system, which is built in the background while the disks are provisioned",
+)
+@click.option(
+    "-I",
+    "--install-bootloader",
+    is_flag=True,
+    help="Like `--install', and install the bootloader too",
+)
 @click.option(
     "-M",
     "--host-mountpoint",
@@ -347,14 +428,24 @@ def main(
     "-P",
     "--partition",
     multiple=True,
-    cls=oreo.Option,
-    xor=["raid"],
-    help="Set up an entire disk; a single `-P' sets up the boot partition with the size as the value passed in (with the unit, such as `2G' for 2 gibibytes),\na second `-P' sets up the swap space similarly, and subsequent invocations sets up further unformatted partitions.\nThe final partition will be the ZFS partition, and does not need to be specified.",
+    help="Set up each of the zfs devices as an entire disk, all at once; a single `-P' sets up the boot partition with the size as the value passed in (with the unit, such as `2G' for 2 gibibytes),\na second `-P' sets up the swap space similarly, and subsequent invocations sets up further unformatted partitions.\nThe final partition will be the ZFS partition, and does not need to be specified.",
 )
 @click.option("-p", "--pool-only", is_flag=True)
-@click.option("-r", "--raid", cls=oreo.Option, xor=["partition"])
+@click.option("-r", "--raid")
 @click.option("-S", "--swap-device", type=(str, int))
 @click.option("-s", "--swap", type=int, default=0)
+@click.option(
+    "-W",
+    "--wipe",
+    is_flag=True,
+    help="Before partitioning, clear the ZFS labels and signatures of the zfs devices, and discard all their blocks, all at once",
+)
+@click.option(
+    "-y",
+    "--yes",
+    is_flag=True,
+    help="Don't ask before deleting everything on the devices, such as when provisioning in batches",
+)
 @click.option("-z", "--zfs-devices", required=True, multiple=True)
 @click.pass_context
 def create(
@@ -363,6 +454,9 @@ def create(
     copies,
     deduplicated,
     encrypted,
+    install,
+    install_bootloader,
+    jobs,
     host_mountpoint,
     mountpoint,
     dataset_options,
@@ -372,11 +466,21 @@ def create(
     raid,
     swap_device,
     swap,
+    wipe,
+    yes,
     zfs_devices,
 ):
+    from strapper.compression import default, default_compression
+
+    if ctx.obj.session:
+        raise click.UsageError(
+            f"Sorry; stop the session holding {ctx.obj.host} with `strapper -H {ctx.obj.host} session --stop' before recreating it!"
+        )
+    build = None
     try:
         if (
-            Prompt.ask(
+            yes
+            or Prompt.ask(
                 "THIS WILL DELETE ALL DATA ON THE SELECTED DEVICE / PARTITION! TO CONTINUE, TYPE IN 'ZFS CREATE'!\n\t"
             )
             == "ZFS CREATE"
@@ -387,7 +491,7 @@ def create(
                 mountpoint=("/" + ctx.obj.host)
                 if host_mountpoint
                 else (mountpoint or "none"),
-                compression="zstd-19",
+                compression=load_tuning().get(default, default_compression),
                 checksum="edonr",
                 atime="off",
                 relatime="off",
@@ -399,99 +503,253 @@ def create(
             if len(zfs_devices) == 1:
                 if raid:
                     raise click.UsageError(no_raid_error_message)
-                else:
-                    zfs_device = zfs_devices[0]
-            else:
-                if raid:
-                    zfs_device = f"{raid} {' '.join(zfs_devices)}"
-                else:
-                    raise click.UsageError(no_raid_error_message)
-            if partition or boot_device:
-                parted.bake_("--", _sudo=True, s=True, a="optimal")
+            elif not raid:
+                raise click.UsageError(no_raid_error_message)
+            zfs_name = ctx.obj.host
+
+            # Every partition is named, and found by its name, however its disk is named.
+            def names(kind):
+                if len(zfs_devices) == 1:
+                    return ["-".join((zfs_name, *kind))]
+                return [
+                    "-".join((zfs_name, *kind, str(i))) for i in range(len(zfs_devices))
+                ]
+
+            scripts = defaultdict(list)
             if partition:
-                zfs_name = ctx.obj.host
-                parted(zfs_device, "mklabel", "gpt")
-                for [i, p] in enumerate(partition):
-                    parted(
-                        zfs_device,
-                        "mkpart",
-                        "primary",
-                        partition[i - 1] if i else "0%",
-                        p,
-                    )
-                parted(
-                    zfs_device,
-                    "mkpart",
-                    "primary",
-                    partition[-1],
-                    "100%",
-                )
-                parted(
-                    zfs_device,
-                    "name",
-                    3 if len(partition) > 1 else 2,
-                    zfs_name,
+                for [device, name] in zip(zfs_devices, names(())):
+                    scripts[device] += layout(partition, name)
+            if boot_device:
+                boot = ["-".join((zfs_name, "boot"))]
+                scripts[boot_device[0]] += boot_commands(boot_device[1], boot[0])
+            elif partition:
+                boot = names(("boot",))
+                for [device, name] in zip(zfs_devices, boot):
+                    scripts[device] += boot_commands(1, name)
+            else:
+                boot = []
+            if swap_device:
+                swap_partitions = ["-".join((zfs_name, "swap"))]
+                scripts[swap_device[0]] += swap_commands(
+                    swap_device[1], swap_partitions[0]
                 )
-            if partition or boot_device:
-                if boot_device:
-                    device = boot_device[0]
-                    index = boot_device[1]
-                    parted(device, "mkfs", index, "fat32")
-                    parted(device, "set", index, "boot", "on")
-                    parted(device, "set", index, "esp", "on")
-                else:
-                    parted(zfs_device, "name", 1, ctx.obj.host + "-boot")
-                    parted(zfs_device, "mkfs", 1, "fat32")
-                    parted(zfs_device, "set", 1, "boot", "on")
-                    parted(zfs_device, "set", 1, "esp", "on")
-            if len(partition) > 1 or swap_device:
-                if swap_device:
-                    parted(swap_device[0], "mkfs", swap_device[1], "linux-swap")
-                else:
-                    parted(zfs_device, "name", 2, ctx.obj.host + "-swap")
-                    parted(zfs_device, "mkfs", 2, "linux-swap")
-            for dataset in zfs.list(r=True, H=True, _list=True, _split=True):
-                if ctx.obj.host in dataset:
+            elif len(partition) > 1:
+                swap_partitions = names(("swap",))
+                for [device, name] in zip(zfs_devices, swap_partitions):
+                    scripts[device] += swap_commands(2, name)
+            else:
+                swap_partitions = []
+            boot = [partlabel(name) for name in boot]
+            swap_partitions = [partlabel(name) for name in swap_partitions]
+            if not partition:
+                vdevs = zfs_devices
+            else:
+                vdevs = tuple(partlabel(name) for name in names(()))
+            installing = install or install_bootloader
+            printing = ctx.find_root().params["print"]
+            system = None
+
+            def prepare_devices():
+                if imported(ctx.obj.host):
                     zpool.export(ctx.obj.host, f=True, _ignore_stderr=True)
-            if encrypted:
-                dataset_options_dict.encryption = "aes-256-gcm"
-                dataset_options_dict.keyformat = "passphrase"
-            if deduplicated:
-                dataset_options_dict.dedup = "edonr,verify"
-            if os.path.ismount("/mnt"):
-                umount("/mnt", R=True)
-            zpool.export(ctx.obj.host, f=True, _ignore_stderr=True)
-            dataset_options_dict.update(
-                {kv[0]: kv[1] for item in pool_options for kv in (item.split("="),)}
-            )
-            pool_options_dict.update(
-                {kv[0]: kv[1] for item in dataset_options for kv in (item.split("="),)}
-            )
-            command(
-                ctx.obj.host,
-                "/dev/disk/by-label/" + zfs_name if partition else zfs_device,
-                O={
-                    "repeat-with-values": (
-                        f"{k}={v}" for [k, v] in dataset_options_dict.items()
+                wipe_devices(zfs_devices, jobs=jobs)
+
+            def create_pool():
+                if imported(ctx.obj.host):
+                    zpool.export(ctx.obj.host, f=True, _ignore_stderr=True)
+                if encrypted:
+                    dataset_options_dict.encryption = "aes-256-gcm"
+                    dataset_options_dict.keyformat = "passphrase"
+                if deduplicated:
+                    dataset_options_dict.dedup = "edonr,verify"
+                zpool.export(ctx.obj.host, f=True, _ignore_stderr=True)
+                if (detected := ashift(zfs_devices)) is not None:
+                    pool_options_dict.ashift = str(detected)
+                dataset_options_dict.update(
+                    {
+                        kv[0]: kv[1]
+                        for item in dataset_options
+                        for kv in (item.split("="),)
+                    }
+                )
+                pool_options_dict.update(
+                    {kv[0]: kv[1] for item in pool_options for kv in (item.split("="),)}
+                )
+                # Only the pool's own root; other pools may be mounted beside it.
+                if os.path.ismount(pool_options_dict.altroot):
+                    umount(pool_options_dict.altroot, R=True)
+                command(
+                    ctx.obj.host,
+                    *((raid,) if raid else ()),
+                    *vdevs,
+                    O={
+                        "repeat-with-values": (
+                            f"{k}={v}" for [k, v] in dataset_options_dict.items()
+                        )
+                    },
+                    o={
+                        "repeat-with-values": (
+                            f"{k}={v}" for [k, v] in pool_options_dict.items()
+                        )
+                    },
+                )
+
+            def build_system():
+                # Building the system needs nothing but the resources, and datasets.nix
+                # among them, which the plan renders without touching the disks.
+                nonlocal build, system
+                if printing:
+                    print(" ".join(Build.command(ctx.obj.resources, ctx.obj.host)))
+                    return
+                build = Build(ctx.obj.resources, ctx.obj.host)
+                print(f"Building the system in the background; see {build.log}")
+                if not (system := build.wait()):
+                    raise click.UsageError(
+                        f"Sorry; building the system failed; see {build.log}!"
                     )
-                },
-                o={
-                    "repeat-with-values": (
-                        f"{k}={v}" for [k, v] in pool_options_dict.items()
+
+            def cancel():
+                if build:
+                    build.cancel()
+
+            # Each stage runs once the stages making its inputs have; the rest of the
+            # disks, and anything not needing them, go on while the pool is created.
+            stages = [
+                *(
+                    ()
+                    if pool_only
+                    else (
+                        Stage(
+                            "datasets.nix",
+                            partial(
+                                update_datasets,
+                                ctx,
+                                encrypted=encrypted,
+                                deduplicated=deduplicated,
+                            ),
+                            outputs=("datasets.nix",),
+                        ),
                     )
-                },
-            )
-            update_datasets(
-                ctx,
-                swap=swap,
-                encrypted=encrypted,
-                deduplicated=deduplicated,
-                pool=True,
-                reserved_only=pool_only,
-            )
+                ),
+                *(
+                    (
+                        Stage(
+                            "build",
+                            build_system,
+                            inputs=("datasets.nix",),
+                            outputs=("system",),
+                        ),
+                    )
+                    if installing
+                    else ()
+                ),
+                *(
+                    (
+                        Stage(
+                            "device preparation", prepare_devices, outputs=("devices",)
+                        ),
+                    )
+                    if wipe
+                    else ()
+                ),
+                Stage(
+                    "partitioning",
+                    partial(partition_disks, scripts, jobs=jobs),
+                    inputs=("devices",),
+                    outputs=("partitions",),
+                ),
+                *(
+                    (
+                        Stage(
+                            "boot filesystem",
+                            partial(format_boot, boot, jobs=jobs),
+                            inputs=("partitions",),
+                            outputs=("boot",),
+                        ),
+                    )
+                    if boot
+                    else ()
+                ),
+                *(
+                    (
+                        Stage(
+                            "swap partition",
+                            partial(format_swap, swap_partitions, jobs=jobs),
+                            inputs=("partitions",),
+                            outputs=("swap partition",),
+                        ),
+                    )
+                    if swap_partitions
+                    else ()
+                ),
+                Stage(
+                    "pool creation",
+                    create_pool,
+                    inputs=("devices", "partitions"),
+                    outputs=("pool",),
+                ),
+                Stage(
+                    "dataset tree",
+                    partial(
+                        update_datasets,
+                        ctx,
+                        encrypted=encrypted,
+                        deduplicated=deduplicated,
+                        pool=True,
+                        reserved_only=pool_only,
+                        jobs=jobs,
+                        swap=swap,
+                    ),
+                    inputs=("pool", "datasets.nix"),
+                    outputs=("datasets",),
+                ),
+                *(
+                    (
+                        Stage(
+                            "mount",
+                            lambda: ctx.invoke(
+                                _mount,
+                                boot_device=boot[0] if boot else None,
+                                deduplicated=deduplicated,
+                                encrypted=encrypted,
+                                jobs=jobs,
+                                swap=bool(swap),
+                                swap_device=None
+                                if swap or not swap_partitions
+                                else swap_partitions[0],
+                            ),
+                            inputs=(
+                                "datasets",
+                                "boot",
+                                "swap partition",
+                            ),
+                            outputs=("mounts",),
+                        ),
+                        Stage(
+                            "install",
+                            lambda: ctx.invoke(
+                                main,
+                                all=True,
+                                install_bootloader=install_bootloader,
+                                jobs=jobs,
+                                seed=bool(system),
+                                system=system,
+                            ),
+                            inputs=("mounts", "system"),
+                        ),
+                    )
+                    if installing
+                    else ()
+                ),
+            ]
+            if printing:
+                print(render(stages, load_timings("create")))
+            run_stages("create", stages, sequential=printing, on_error=cancel)
         else:
             print("Sorry; not continuing!\n\n")
     finally:
+        if build:
+            build.cancel()
         zpool.export(ctx.obj.host, f=True, _ignore_stderr=True)
 
 
@@ -499,6 +757,13 @@ def create(
 @click.option("-b", "--boot-device")
 @click.option("-d", "--deduplicated", is_flag=True)
 @click.option("-e", "--encrypted", is_flag=True)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    help="The number of datasets to mount at once",
+)
 @click.option("-r", "--root-device")
 @click.option("-s", "--swap", cls=oreo.Option, xor=["swap-device"], is_flag=True)
 @click.option("-S", "--swap-device", cls=oreo.Option, xor=["swap"])
@@ -510,6 +775,7 @@ def _mount(
     boot_device,
     deduplicated,
     encrypted,
+    jobs,
     root_device,
     swap,
     swap_device,
@@ -524,61 +790,27 @@ def _mount(
         swap=swap,
     )
 
-    for dataset in zfs.list(r=True, H=True, _list=True, _split=True):
-        if ctx.obj.host in dataset:
-            break
-    else:
-        zpool(ctx.obj.host, _subcommand="import", f=True)
-
-    if encrypted:
-        zfs.load_key(ctx.obj.host)
+    with tracer.phase("mount"):
+        if not imported(ctx.obj.host):
+            zpool(ctx.obj.host, _subcommand="import", f=True)
 
-    try:
-        Path("/mnt").mkdir()
-    except FileExistsError:
-        if os.path.ismount("/mnt"):
-            umount("/mnt", R=True)
-    if root_device:
-        mount(root_device, "/mnt")
-    else:
-        mount(ctx.obj.host + "/system/root", "/mnt", t="zfs")
+        if encrypted:
+            zfs.load_key(ctx.obj.host)
 
-    # Adapted From: https://github.com/NixOS/nixpkgs/issues/73404#issuecomment-1011485428
-    try:
-        Path("/mnt/mnt").mkdir()
-    except FileExistsError:
-        if os.path.ismount("/mnt/mnt"):
-            umount("/mnt/mnt", R=True)
-    mount("/mnt", "/mnt/mnt", bind=True)
-
-    Path("/mnt/etc/nixos").mkdir(parents=True, exist_ok=True)
-
-    Path("/mnt/nix").mkdir(parents=True, exist_ok=True)
-    mount(ctx.obj.host + "/system/nix", "/mnt/nix", t="zfs")
-
-    Path("/mnt/persist").mkdir(parents=True, exist_ok=True)
-    mount(ctx.obj.host + "/system/persist", "/mnt/persist", t="zfs")
-
-    if boot_device:
-        Path(boot := "/mnt/boot/efi").mkdir(parents=True, exist_ok=True)
-        mount(boot_device, boot)
-    if swap:
-        swapon(
-            "/dev/zvol/" + ctx.obj.host + "/swap" + hy.models.Keyword("m/run") + True
+        mount_all(
+            mount_plan(
+                current_plan(ctx, encrypted=encrypted, deduplicated=deduplicated),
+                root_device=root_device,
+                boot_device=boot_device,
+            ),
+            jobs=jobs,
         )
-    if swap_device:
-        swapon(swap_device, _run=True)
-
-    Path("/tmp").mkdir(parents=True, exist_ok=True)
-    mount(ctx.obj.host + "/system/tmp", "/tmp", t="zfs", _run=True)
-
-    Path("/tmp/nix").mkdir(parents=True, exist_ok=True)
-    mount(
-        ctx.obj.host + "/system/tmp/nix",
-        "/tmp/nix",
-        t="zfs",
-        _run=True,
-    )
+        Path(system_root(), "mnt", "etc", "nixos").mkdir(parents=True, exist_ok=True)
+
+        if swap:
+            swapon("/dev/zvol/" + ctx.obj.host + "/swap", _run=True)
+        if swap_device:
+            swapon(swap_device, _run=True)
 
     if install or install_bootloader:
         ctx.invoke(main, all=True, install_bootloader=install_bootloader)
@@ -593,30 +825,285 @@ def _mount(
     is_flag=True,
     help="Update datasets.nix with any new datasets; the default",
 )
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    help="The number of datasets to create at once",
+)
 @click.option(
     "-p",
     "--pool",
     is_flag=True,
     help="Update the pool and datasets.nix with any new datasets",
 )
+@click.option(
+    "-P",
+    "--plan",
+    is_flag=True,
+    help="Print the changes `--pool' would make to the pool without making them",
+)
 @click.option("-r", "--root-device")
 @click.option("-s", "--swap", type=int, default=0)
 @click.pass_context
-def update(ctx, deduplicated, encrypted, files, pool, root_device, swap):
-    try:
-        ud = partial(
-            update_datasets,
-            ctx,
-            swap=swap,
-            encrypted=encrypted,
-            deduplicated=deduplicated,
-            root_device=root_device,
+def update(ctx, deduplicated, encrypted, files, jobs, pool, plan, root_device, swap):
+    ud = partial(
+        update_datasets,
+        ctx,
+        swap=swap,
+        encrypted=encrypted,
+        deduplicated=deduplicated,
+        root_device=root_device,
+        jobs=jobs,
+    )
+    # Without the pool, every dataset of the plan would look missing from it.
+    if (plan or pool) and not ctx.obj.session and not imported(ctx.obj.host):
+        raise click.UsageError(
+            f"Sorry; {ctx.obj.host} isn't imported; import it, or mount it, first!"
         )
-        if files:
-            ud()
-        elif pool:
+    if plan:
+        ud(pool=True, plan_only=True)
+    elif pool and not files:
+        try:
             ud(pool=True)
-        else:
-            ud()
-    finally:
-        zpool.export(ctx.obj.host, f=True, _ignore_stderr=True)
+        finally:
+            export_pool(ctx)
+    else:
+        ud()
+
+
+@strapper.command(no_args_is_help=True, name="tune-compression")
+@click.option(
+    "-c",
+    "--codec",
+    "selected",
+    multiple=True,
+    help="Only try this compression, such as `lz4' or `zstd-3'; may be repeated",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=os.cpu_count(),
+    show_default=True,
+    help="The number of cores to compress on",
+)
+@click.option(
+    "-l",
+    "--limit",
+    default="256M",
+    show_default=True,
+    help="How much of each class's sample data to read",
+)
+@click.option(
+    "-m",
+    "--minimum",
+    type=float,
+    default=500.0,
+    show_default=True,
+    help="The slowest compression allowed, in MB/s across all the cores",
+)
+@click.option(
+    "-n",
+    "--no-write",
+    is_flag=True,
+    help="Only print the results, without writing the chosen compression into the plan",
+)
+@click.option(
+    "-s",
+    "--sample",
+    "samples",
+    type=(str, click.Path(exists=True, file_okay=False)),
+    multiple=True,
+    required=True,
+    help="A dataset class, either `default' or a profile, and a directory of data like what it will hold; may be repeated",
+)
+@click.pass_context
+def tune_compression(ctx, selected, jobs, limit, minimum, no_write, samples):
+    from strapper.compression import default
+    from strapper.profiles import profiles
+
+    classes = defaultdict(list)
+    for [cls, path] in samples:
+        if not (cls == default or cls in profiles):
+            raise click.UsageError(
+                f"Sorry; `{cls}' is neither `{default}' nor one of the profiles: {', '.join(profiles)}!"
+            )
+        classes[cls].append(path)
+    available = codecs()
+    if missing := [codec for codec in selected if not codec in available]:
+        raise click.UsageError(
+            f"Sorry; can't try {', '.join(missing)}! Installing the `lz4' and `zstandard' modules adds their codecs."
+        )
+    if not (
+        available := {c: available[c] for c in selected} if selected else available
+    ):
+        raise click.UsageError(
+            "Sorry; there is nothing to try! Install the `lz4' or `zstandard' modules first."
+        )
+    tuning = load_tuning()
+    for [cls, paths] in classes.items():
+        if not (blocks := sample_blocks(paths, recordsize(cls), parse_size(limit))):
+            raise click.UsageError(f"Sorry; there are no files in {', '.join(paths)}!")
+        results = {
+            codec: measure(blocks, compress, jobs=jobs)
+            for [codec, compress] in available.items()
+        }
+        tuning[cls] = recommend(results, minimum)
+        print(
+            f"{cls}: {sum(map(len, blocks))} bytes in {len(blocks)} blocks of up to {recordsize(cls)} bytes"
+        )
+        for [codec, [ratio, speed]] in results.items():
+            print(
+                f"\t{'*' if codec == tuning[cls] else ' '} {codec:<16}{ratio:8.3f}x{speed:10.1f} MB/s"
+            )
+    if not no_write:
+        save_tuning(tuning)
+
+
+@strapper.command(no_args_is_help=True, name="estimate-dedup")
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=os.cpu_count(),
+    show_default=True,
+    help="The number of files to read and hash at once",
+)
+@click.option(
+    "-k",
+    "--sketch-size",
+    type=click.IntRange(min=2),
+    default=2**16,
+    show_default=True,
+    help="How many block hashes to keep per dataset; unique blocks are counted exactly up to this many, and estimated past it",
+)
+@click.option(
+    "-m",
+    "--minimum-ratio",
+    type=float,
+    default=2.0,
+    show_default=True,
+    help="The dedup ratio a dataset needs for deduplication to be worth its memory",
+)
+@click.option(
+    "-s",
+    "--sample",
+    "samples",
+    type=(str, click.Path(exists=True, file_okay=False)),
+    multiple=True,
+    required=True,
+    help="A dataset in the plan, with or without the pool's name, and a directory of data like what it will hold; may be repeated",
+)
+@click.pass_context
+def estimate_dedup(ctx, jobs, sketch_size, minimum_ratio, samples):
+    from strapper.dedup import ddt_entry_size
+
+    plan = current_plan(ctx)
+    datasets = defaultdict(list)
+    for [dataset, path] in samples:
+        name = dataset if dataset in plan.index else ctx.obj.host + "/" + dataset
+        if not name in plan.index:
+            raise click.UsageError(f"Sorry; {dataset} isn't a dataset in the plan!")
+        datasets[name].append(path)
+    sketches = estimate(plan, datasets, jobs=jobs, size=sketch_size)
+    pool = Sketch(sketch_size)
+
+    def row(name, sketch):
+        return f"{'*' if sketch.ratio() >= minimum_ratio else ' '} {name:<30}{sketch.blocks:>11}{sketch.unique():>11}{sketch.ratio():>8.2f}x{sketch.unique() * ddt_entry_size:>14}"
+
+    print(f"  {'dataset':<30}{'blocks':>11}{'unique':>11}{'ratio':>9}{'DDT bytes':>14}")
+    for [dataset, sketch] in sketches.items():
+        pool.update(sketch)
+        print(row(dataset, sketch))
+    print(row("all of the above", pool))
+    print(f"* a dedup ratio of at least {minimum_ratio}x, worth the memory")
+
+
+@strapper.command(no_args_is_help=True)
+@click.option(
+    "-a",
+    "--all",
+    "everything",
+    is_flag=True,
+    help="Reset every dataset in the plan, other than those excluded",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    help="The number of subtrees to reset at once",
+)
+@click.option(
+    "-s",
+    "--subtree",
+    "subtrees",
+    multiple=True,
+    help="Reset this dataset and everything under it, such as `system/root'; may be repeated",
+)
+@click.option(
+    "-t",
+    "--tag",
+    "tags",
+    multiple=True,
+    help="Reset the datasets with this tag in datasets.yaml, such as `ephemeral'; may be repeated",
+)
+@click.option(
+    "-x",
+    "--exclude",
+    multiple=True,
+    help="Leave this dataset and everything under it alone, such as `system/persist'; may be repeated",
+)
+@click.pass_context
+def reset(ctx, everything, jobs, subtrees, tags, exclude):
+    # Rolls datasets back to their `@blank' snapshots, destroying any later snapshots.
+    if not (everything or subtrees or tags):
+        raise click.UsageError(
+            "Sorry; choose what to reset with `-a / --all', `-s / --subtree' or `-t / --tag'!"
+        )
+    plan = current_plan(ctx)
+    if not (nodes := select(plan, subtrees, tags, exclude, everything)):
+        raise click.UsageError("Sorry; nothing in the plan matches!")
+    with tracer.phase("reset"):
+        start = time.perf_counter()
+        timings = reset_datasets(plan, nodes, jobs=jobs)
+    print(
+        f"Reset {len(timings)} datasets in {time.perf_counter() - start:.3f}s; the slowest took {max(timings.values(), default=0):.3f}s."
+    )
+
+
+@strapper.command()
+@click.option(
+    "-s",
+    "--stop",
+    is_flag=True,
+    cls=oreo.Option,
+    xor=["status"],
+    help="Stop the running session, exporting the pool if the session imported it",
+)
+@click.option(
+    "-S",
+    "--status",
+    is_flag=True,
+    cls=oreo.Option,
+    xor=["stop"],
+    help="Print the status of the running session",
+)
+@click.pass_context
+def session(ctx, stop, status):
+    # Keeps the pool imported, and the plan and the pool's properties in memory, for the
+    # other commands run on the host until stopped; they find it through its socket.
+    if stop or status:
+        if not ctx.obj.session:
+            raise click.UsageError(
+                f"Sorry; there is no session running for {ctx.obj.host}!"
+            )
+        print(ctx.obj.session.stop() if stop else ctx.obj.session.status())
+    elif ctx.obj.session:
+        raise click.UsageError(
+            f"Sorry; a session is already running for {ctx.obj.host}!"
+        )
+    else:
+        serve(ctx.obj.host)
@@ -0,0 +1,232 @@
+import os
+import stat
+
+from pathlib import Path
+
+import strapper.files as files
+
+from strapper.files import file_digest, write_atomic
+from strapper.lazy import lazy
+
+fcntl = lazy("fcntl")
+hashlib = lazy("hashlib")
+json = lazy("orjson")
+shutil = lazy("shutil")
+
+# From `linux/fs.h'; clones a whole file on filesystems that support reflinks.
+FICLONE = 0x40049409
+
+# Bump this whenever the layout of a manifest changes.
+manifest_version = 1
+
+
+class Report:
+    __slots__ = ("files", "bytes", "attributes", "deleted", "unchanged")
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        # Files whose content was already there, but not their mode, owner or mtime.
+        self.attributes = 0
+        self.deleted = 0
+        self.unchanged = 0
+
+    def __str__(self):
+        return f"Copied {self.files} files ({self.bytes} bytes), updated the attributes of {self.attributes}, deleted {self.deleted}, and left {self.unchanged} unchanged."
+
+
+def manifest_path(source, destination, cache_dir=None):
+    key = hashlib.sha256(
+        json.dumps([manifest_version, str(source), str(destination)])
+    ).hexdigest()
+    return Path(cache_dir or files.cache_dir("manifests"), key + ".json")
+
+
+def walk(root, relative=""):
+    # (relative path, `os.DirEntry'), parents before their contents
+    with os.scandir(os.path.join(root, relative) if relative else root) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+    for entry in entries:
+        path = os.path.join(relative, entry.name) if relative else entry.name
+        yield path, entry
+        if entry.is_dir(follow_symlinks=False):
+            yield from walk(root, path)
+
+
+def copy_data(source, destination):
+    # A reflink where the filesystems allow it, then `copy_file_range', then a plain copy.
+    try:
+        fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+        return
+    except OSError:
+        pass
+    size = os.fstat(source.fileno()).st_size
+    try:
+        copied = 0
+        while copied < size:
+            if not (
+                n := os.copy_file_range(
+                    source.fileno(), destination.fileno(), size - copied
+                )
+            ):
+                break
+            copied += n
+        return
+    except (AttributeError, OSError):
+        source.seek(0)
+        destination.seek(0)
+        destination.truncate()
+    shutil.copyfileobj(source, destination)
+
+
+def remove(path):
+    # Whatever is at `path', so that something of another type can take its place.
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        path.unlink()
+
+
+def copy_attributes(path, status, current=None):
+    # The mode, owner and times of `status', where `current' differs from them; returns
+    # whether anything changed.
+    changed = False
+    if current is None or stat.S_IMODE(current.st_mode) != stat.S_IMODE(status.st_mode):
+        os.chmod(path, stat.S_IMODE(status.st_mode))
+        changed = True
+    if current is None or (current.st_uid, current.st_gid) != (
+        status.st_uid,
+        status.st_gid,
+    ):
+        try:
+            os.chown(path, status.st_uid, status.st_gid)
+            changed = True
+        except PermissionError:
+            pass
+    if current is None or current.st_mtime_ns != status.st_mtime_ns:
+        os.utime(path, ns=(status.st_atime_ns, status.st_mtime_ns))
+        changed = True
+    return changed
+
+
+def copy_file(source, destination, status):
+    temporary = destination.with_name(f".{destination.name}.{os.getpid()}.tmp")
+    try:
+        with open(source, "rb") as s, open(temporary, "wb") as d:
+            copy_data(s, d)
+        copy_attributes(temporary, status)
+        os.replace(temporary, destination)
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+
+
+def sync_tree(source, destination, delete=False, cache_dir=None):
+    # Copies `source' into `destination' like `rsync -a' would, but only the files whose
+    # content changed, and the attributes of the rest where they did; the manifest
+    # remembers the size, mtime and hash of every file on both sides, so unchanged
+    # files are never read again. Anything that changed type is replaced. With
+    # `delete', files this function copied before, and that are gone from `source',
+    # are removed.
+    source = Path(source)
+    destination = Path(destination)
+    report = Report()
+    path = manifest_path(source.resolve(), destination.resolve(), cache_dir)
+    try:
+        old = json.loads(path.read_bytes())
+    except (OSError, ValueError):
+        old = dict(source=dict(), destination=dict())
+    sources = dict()
+    destinations = dict()
+    # Directories get their mode and times last, once nothing is left to change in them.
+    last = []
+    destination.mkdir(parents=True, exist_ok=True)
+    for [relative, entry] in walk(source):
+        target = destination / relative
+        status = entry.stat(follow_symlinks=False)
+        if entry.is_symlink():
+            link = os.readlink(entry.path)
+            if not (target.is_symlink() and os.readlink(target) == link):
+                remove(target)
+                os.symlink(link, target)
+                report.files += 1
+            else:
+                report.unchanged += 1
+            destinations[relative] = ["link", link]
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            if target.is_symlink() or not target.is_dir():
+                remove(target)
+                target.mkdir()
+            last.append((target, status))
+            destinations[relative] = ["directory"]
+            continue
+        if not entry.is_file(follow_symlinks=False):
+            continue
+        cached = old["source"].get(relative)
+        if cached and cached[:2] == [status.st_size, status.st_mtime_ns]:
+            digest = cached[2]
+        else:
+            digest = file_digest(entry.path).hex()
+        sources[relative] = [status.st_size, status.st_mtime_ns, digest]
+        try:
+            current = os.lstat(target)
+        except FileNotFoundError:
+            current = None
+        if current and not stat.S_ISREG(current.st_mode):
+            remove(target)
+            current = None
+        recorded = old["destination"].get(relative)
+        if (
+            current
+            and current.st_size == status.st_size
+            and (
+                recorded == [current.st_size, current.st_mtime_ns, digest]
+                or file_digest(target).hex() == digest
+            )
+        ):
+            if copy_attributes(target, status, current):
+                report.attributes += 1
+                current = os.lstat(target)
+            else:
+                report.unchanged += 1
+        else:
+            copy_file(entry.path, target, status)
+            report.files += 1
+            report.bytes += status.st_size
+            current = os.lstat(target)
+        destinations[relative] = [current.st_size, current.st_mtime_ns, digest]
+    if delete:
+        directories = []
+        for [relative, recorded] in old["destination"].items():
+            if relative in destinations:
+                continue
+            if recorded == ["directory"]:
+                directories.append(relative)
+                continue
+            try:
+                (destination / relative).unlink()
+                report.deleted += 1
+            except FileNotFoundError:
+                pass
+        # Deepest first, and only once nothing is left in them, such as files put there
+        # by something else.
+        for relative in sorted(directories, key=lambda path: -path.count("/")):
+            try:
+                (destination / relative).rmdir()
+                report.deleted += 1
+            except OSError:
+                pass
+    elif old["destination"]:
+        # Keep remembering files that could still be deleted by a later run.
+        for relative in old["destination"].keys() - destinations.keys():
+            if os.path.lexists(destination / relative):
+                destinations[relative] = old["destination"][relative]
+    for [target, status] in reversed(last):
+        os.chmod(target, stat.S_IMODE(status.st_mode))
+        os.utime(target, ns=(status.st_atime_ns, status.st_mtime_ns))
+    try:
+        write_atomic(path, json.dumps(dict(source=sources, destination=destinations)))
+    except OSError:
+        pass
+    return report
@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+from strapper.lazy import lazy
+
+json = lazy("orjson")
+
+
+class Tracer:
+    # Records every traced program call, along with the phase of strapper it was part of,
+    # once enabled; until then tracing costs a single attribute check per call.
+    def __init__(self):
+        self.enabled = False
+        self.current = "setup"
+        # The phases of threads other than the main one, such as concurrent stages.
+        self.local = threading.local()
+        self.events = []
+        self.phases = []
+        self.lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+        self.start = time.perf_counter_ns()
+
+    def here(self):
+        return getattr(self.local, "current", None) or self.current
+
+    @contextmanager
+    def within(self, name):
+        # Puts the calls of this thread in phase `name' without recording it again, for
+        # the threads a phase hands its work to.
+        previous = getattr(self.local, "current", None)
+        self.local.current = name
+        try:
+            yield
+        finally:
+            self.local.current = previous
+
+    @contextmanager
+    def phase(self, name):
+        main = threading.current_thread() is threading.main_thread()
+        previous = self.current if main else getattr(self.local, "current", None)
+        if main:
+            self.current = name
+        else:
+            self.local.current = name
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                with self.lock:
+                    self.phases.append((name, start, time.perf_counter_ns()))
+            if main:
+                self.current = previous
+            else:
+                self.local.current = previous
+
+    def record(self, argv, start, end, status, size):
+        with self.lock:
+            self.events.append(
+                (argv, start, end, status, size, self.here(), threading.get_ident())
+            )
+
+    def chrome(self):
+        # The Chrome trace-event format, as read by `chrome://tracing' and Perfetto.
+        pid = os.getpid()
+        events = [
+            dict(
+                name=name,
+                cat="phase",
+                ph="X",
+                ts=(start - self.start) / 1000,
+                dur=(end - start) / 1000,
+                pid=pid,
+                tid=0,
+            )
+            for [name, start, end] in self.phases
+        ]
+        events += (
+            dict(
+                name=" ".join(argv[:2]),
+                cat=phase,
+                ph="X",
+                ts=(start - self.start) / 1000,
+                dur=(end - start) / 1000,
+                pid=pid,
+                tid=tid,
+                args=dict(argv=argv, status=status, output=size),
+            )
+            for [argv, start, end, status, size, phase, tid] in self.events
+        )
+        return dict(traceEvents=events, displayTimeUnit="ms")
+
+    def write(self, path):
+        with open(path, "wb") as f:
+            f.write(json.dumps(self.chrome()))
+
+    def summary(self, slowest=10):
+        lines = ["Slowest commands:"]
+        for [argv, start, end, status, size, phase, _] in sorted(
+            self.events, key=lambda event: event[1] - event[2]
+        )[:slowest]:
+            lines.append(
+                f"\t{(end - start) / 1e9:9.3f}s\t{phase:<16}\t{status:>3}\t{' '.join(argv)}"
+            )
+        totals = dict()
+        for [argv, start, end, status, size, phase, _] in self.events:
+            totals[phase] = totals.get(phase, 0) + (end - start)
+        lines.append("Time spent in commands per phase:")
+        for [phase, total] in sorted(totals.items(), key=lambda item: -item[1]):
+            lines.append(f"\t{total / 1e9:9.3f}s\t{phase}")
+        return "\n".join(lines)
+
+
+tracer = Tracer()
+
+
+def output_size(result):
+    try:
+        return len(result)
+    except TypeError:
+        return 0
+
+
+def options(kwargs):
+    # An approximation of the options bakery passes for the keyword arguments of a call.
+    for [key, value] in kwargs.items():
+        if key.startswith("_") or value is None or value is False:
+            continue
+        flag = ("-" if len(key) == 1 else "--") + key.replace("_", "-")
+        if value is True:
+            yield flag
+        elif isinstance(value, dict):
+            for repeated in value.get("repeat-with-values", ()):
+                yield flag
+                yield str(repeated)
+            for _ in range(value.get("repeat", 0)):
+                yield flag
+        else:
+            yield flag
+            yield str(value)
+
+
+class traced:
+    # Wraps a bakery program, or one of its subcommands, recording each call with `tracer'.
+    __slots__ = ("_program", "_argv")
+
+    def __init__(self, program, argv):
+        self._program = program
+        self._argv = argv
+
+    def __getattr__(self, attr):
+        value = getattr(self._program, attr)
+        if attr.endswith("_") or not callable(value):
+            return value
+        return traced(value, self._argv + (attr.replace("_", "-"),))
+
+    def __call__(self, *args, **kwargs):
+        if not tracer.enabled:
+            return self._program(*args, **kwargs)
+        argv = [
+            *self._argv,
+            *((kwargs["_subcommand"],) if "_subcommand" in kwargs else ()),
+            *options(kwargs),
+            *(str(arg) for arg in args if arg != ""),
+        ]
+        status = 0
+        result = None
+        start = time.perf_counter_ns()
+        try:
+            result = self._program(*args, **kwargs)
+            return result
+        except BaseException as error:
+            status = getattr(error, "returncode", None) or getattr(error, "code", 1)
+            raise
+        finally:
+            tracer.record(
+                argv, start, time.perf_counter_ns(), status, output_size(result)
+            )
+
+    def __repr__(self):
+        return f"traced({' '.join(self._argv)!r})"
+
+
+def program(name):
+    return traced(lazy("bakery", name), (name.replace("_", "-"),))
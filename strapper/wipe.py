@@ -0,0 +1,81 @@
+import os
+import stat
+import time
+
+from pathlib import Path
+
+from strapper.lazy import lazy
+from strapper.partitions import sysfs_dir
+from strapper.scheduler import run_graph
+from strapper.trace import program
+
+print = lazy("rich", "print")
+
+blkdiscard = program("blkdiscard")
+fallocate = program("fallocate")
+wipefs = program("wipefs")
+zpool = program("zpool")
+
+
+def partitions(device, sysfs=None):
+    # The partitions currently on a block device, such as `/dev/sda1' for `/dev/sda'.
+    name = os.path.basename(os.path.realpath(device))
+    try:
+        return sorted(
+            "/dev/" + entry.name
+            for entry in os.scandir(Path(sysfs or sysfs_dir(), name))
+            if entry.name.startswith(name) and Path(entry.path, "partition").exists()
+        )
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
+
+def discards(device, sysfs=None):
+    name = os.path.basename(os.path.realpath(device))
+    try:
+        return (
+            int(
+                Path(
+                    sysfs or sysfs_dir(), name, "queue", "discard_max_bytes"
+                ).read_text()
+            )
+            > 0
+        )
+    except (OSError, ValueError):
+        return False
+
+
+def wipe_device(device, sysfs=None):
+    # Clears the ZFS labels of the device and of any of its partitions, erases every
+    # signature wipefs knows of, then discards the whole device if it supports that.
+    # Regular files, such as the backing files of loop devices, work too; discarding one
+    # punches a hole through the whole file.
+    start = time.perf_counter()
+    regular = stat.S_ISREG(os.stat(device).st_mode)
+    for path in () if regular else partitions(device, sysfs):
+        zpool.labelclear(path, f=True, _ignore_stderr=True)
+        wipefs(path, a=True)
+    zpool.labelclear(device, f=True, _ignore_stderr=True)
+    wipefs(device, a=True)
+    if regular:
+        fallocate(device, p=True, o=0, l=os.stat(device).st_size)
+        discarded = True
+    elif discarded := discards(device, sysfs):
+        blkdiscard(device, f=True)
+    seconds = time.perf_counter() - start
+    print(
+        f"Wiped {device}{'' if discarded else ' (without discarding)'} in {seconds:.2f}s"
+    )
+    return seconds
+
+
+def wipe_devices(devices, jobs=1, sysfs=None):
+    # device -> seconds taken, wiping up to `jobs' devices at once
+    devices = list(dict.fromkeys(devices))
+    results = run_graph(
+        devices,
+        [set() for _ in devices],
+        lambda device: wipe_device(device, sysfs),
+        jobs=jobs,
+    )
+    return {devices[i]: seconds for [i, seconds] in results.items()}
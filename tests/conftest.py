@@ -0,0 +1,35 @@
+import pytest
+
+
+class Program:
+    # Stands in for a traced program, recording its calls, and those of its
+    # subcommands, in `calls' as (program, *arguments), without running anything.
+    def __init__(self, calls, argv):
+        self.calls = calls
+        self.argv = argv
+
+    def __getattr__(self, attr):
+        return Program(self.calls, self.argv + (attr,))
+
+    def __call__(self, *args, **kwargs):
+        self.calls.append(
+            (
+                *self.argv,
+                *((kwargs["_subcommand"],) if "_subcommand" in kwargs else ()),
+                *(str(arg) for arg in args if arg != ""),
+            )
+        )
+
+
+@pytest.fixture
+def programs(monkeypatch):
+    # `programs(module, "zfs", ...)' replaces those programs of `module'; every call to
+    # any of them ends up in the list returned.
+    calls = []
+
+    def replace(module, *names):
+        for name in names:
+            monkeypatch.setattr(module, name, Program(calls, (name,)))
+        return calls
+
+    return replace
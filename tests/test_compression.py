@@ -0,0 +1,39 @@
+from strapper.compression import (
+    default,
+    default_recordsize,
+    load_tuning,
+    measure,
+    recommend,
+    recordsize,
+    save_tuning,
+    stored,
+)
+
+
+def test_tuning_round_trip(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert load_tuning() == dict()
+    save_tuning({default: "zstd-3", "nix-store": "lz4"})
+    assert load_tuning() == {default: "zstd-3", "nix-store": "lz4"}
+    assert (tmp_path / "strapper" / "compression.json").exists()
+
+
+def test_recordsize():
+    assert recordsize("vm-images") == 64 * 1024
+    assert recordsize(default) == default_recordsize
+
+
+def test_stored():
+    # Less than an eighth saved isn't worth it, and whole sectors are allocated.
+    assert stored(8192, 7500, 4096) == 8192
+    assert stored(8192, 100, 4096) == 4096
+    assert stored(4096, 4000, 512) == 4096
+
+
+def test_measure_and_recommend():
+    blocks = [b"\0" * 8192] * 4
+    [ratio, speed] = measure(blocks, lambda block: block[:10], jobs=2)
+    assert ratio == 2.0 and speed > 0
+    results = {"zstd-19": (3.0, 10.0), "zstd-3": (2.5, 300.0), "lz4": (2.0, 900.0)}
+    assert recommend(results, 100) == "zstd-3"
+    assert recommend(results, 1000) == "lz4"
@@ -0,0 +1,34 @@
+import random
+
+from strapper.dedup import Sketch
+
+
+def test_exact_below_the_size():
+    sketch = Sketch(size=64)
+    for value in [5, 3, 5, 9, 3, 1]:
+        sketch.add(value)
+    assert sketch.unique() == 4
+
+
+def test_estimate_past_the_size():
+    generator = random.Random(0)
+    values = list({generator.getrandbits(64) for _ in range(20000)})
+    sketch = Sketch(size=1024)
+    for value in values + values:
+        sketch.add(value)
+    assert len(sketch.members) == 1024
+    assert abs(sketch.unique() - len(values)) < len(values) * 0.1
+
+
+def test_merged_sketches_count_the_union():
+    [left, right] = [Sketch(size=64), Sketch(size=64)]
+    for value in range(10):
+        left.add(value)
+    for value in range(5, 20):
+        right.add(value)
+    left.blocks = 10
+    right.blocks = 15
+    merged = Sketch(size=64).update(left).update(right)
+    assert merged.unique() == 20
+    assert merged.blocks == 25
+    assert merged.ratio() == 25 / 20
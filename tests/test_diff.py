@@ -0,0 +1,46 @@
+from strapper.diff import diff_plan, split_options
+from strapper.inventory import Inventory, Properties, normalize
+from strapper.plan import build_plan, read_resources
+
+
+def applied(plan):
+    # The pool as it is once every change of the plan has been made.
+    return Properties(
+        {
+            node.name: {
+                prop: normalize(prop, value)
+                for [prop, value] in split_options(node.options).items()
+            }
+            for node in plan
+        }
+    )
+
+
+def test_everything_is_created_on_an_empty_pool():
+    plan = build_plan("tank", read_resources())
+    changes = diff_plan(plan, Inventory(), Properties())
+    assert changes
+    assert [node.name for node in changes.create] == [node.name for node in plan]
+    assert not changes.set and not changes.extra
+
+
+def test_a_second_run_is_a_no_op():
+    plan = build_plan("tank", read_resources())
+    properties = applied(plan)
+    changes = diff_plan(plan, properties.inventory(), properties)
+    assert not changes
+    assert changes.render() == "Nothing to do!"
+
+
+def test_changed_and_extra_datasets():
+    plan = build_plan("tank", read_resources())
+    properties = applied(plan)
+    [node] = [node for node in plan if split_options(node.options)][:1]
+    [prop, value] = next(iter(split_options(node.options).items()))
+    properties.datasets[node.name][prop] = "changed"
+    properties.datasets["tank/stray"] = dict()
+    properties.datasets["tank/system@blank"] = dict()
+    changes = diff_plan(plan, properties.inventory(), properties)
+    assert changes.set == ((node.name, prop, value, "changed"),)
+    assert changes.extra == ("tank/stray",)
+    assert not changes.create
@@ -0,0 +1,50 @@
+import os
+
+from pathlib import Path
+
+from strapper.files import (
+    cache_dir,
+    digest,
+    file_digest,
+    runtime_dir,
+    write_atomic,
+    write_if_changed,
+)
+
+
+def test_file_digest(tmp_path):
+    (path := tmp_path / "file").write_bytes(b"content")
+    assert file_digest(path) == digest(b"content")
+    assert file_digest(tmp_path / "missing") is None
+
+
+def test_unchanged_content_is_left_alone(tmp_path):
+    path = tmp_path / "datasets.nix"
+    assert write_if_changed(path, "host: { }")
+    assert path.read_text() == "host: { }"
+    assert os.stat(path).st_mode & 0o777 == 0o644
+    os.utime(path, ns=(0, 10**18))
+    assert not write_if_changed(path, b"host: { }")
+    assert os.stat(path).st_mtime_ns == 10**18
+
+
+def test_changed_content_keeps_the_mode(tmp_path):
+    path = tmp_path / "datasets.nix"
+    path.write_text("old")
+    os.chmod(path, 0o600)
+    assert write_if_changed(path, "new")
+    assert path.read_text() == "new"
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert os.listdir(tmp_path) == ["datasets.nix"]
+
+
+def test_user_dirs(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    assert cache_dir("plans") == tmp_path / "strapper" / "plans"
+    assert runtime_dir("tank.sock") == Path("/run/strapper/tank.sock")
+
+
+def test_write_atomic_makes_the_directory(tmp_path):
+    write_atomic(path := tmp_path / "plans" / "key.json", b"[]")
+    assert path.read_bytes() == b"[]"
@@ -0,0 +1,67 @@
+import pytest
+
+from strapper.inventory import Properties, normalize, parse_size, stream
+
+
+@pytest.fixture
+def tools(monkeypatch, tmp_path):
+    # `zfs' and `zpool' that print what `tmp_path/<tool>.out' holds, and log their
+    # arguments to `tmp_path/<tool>.log'.
+    for tool in ("zfs", "zpool"):
+        script = tmp_path / tool
+        script.write_text(
+            f'#!/bin/sh\necho "$@" >> {tmp_path}/{tool}.log\ncat {tmp_path}/{tool}.out\n'
+        )
+        script.chmod(0o755)
+        (tmp_path / f"{tool}.out").write_text("")
+    monkeypatch.setenv("PATH", f"{tmp_path}:/usr/bin:/bin")
+    return tmp_path
+
+
+def test_parse_size():
+    assert parse_size("1.5K") == 1536
+    assert parse_size("512GiB") == 512 * 1024**3
+    assert parse_size("none") == 0
+    assert parse_size("4096") == 4096
+    assert normalize("refreservation", "1G") == str(1024**3)
+    assert normalize("compression", "zstd") == "zstd"
+
+
+def test_properties_load(tools):
+    (tools / "zfs.out").write_text(
+        "tank\tcompression\tzstd\n"
+        "tank/swap\tvolsize\t1073741824\n"
+        "tank/swap\tcomment\twith\ttabs\n"
+    )
+    (tools / "zpool.out").write_text("tank\tsize\t1000\ntank\tfree\t600\n")
+    properties = Properties.load("tank")
+    assert properties["tank"] == dict(compression="zstd")
+    assert properties.get("tank/swap", "volsize") == "1073741824"
+    assert properties.get("tank/swap", "comment") == "with\ttabs"
+    assert properties["tank/missing"] == dict()
+    assert properties.pool_bytes() == 1000
+    assert sorted(properties.inventory()) == ["tank", "tank/swap"]
+    assert (tools / "zpool.log").read_text().split() == [
+        *("get", "-H", "-p", "-o", "name,property,value", "all", "tank")
+    ]
+
+
+def test_properties_of_a_missing_pool(tools):
+    properties = Properties.load("tank")
+    assert properties.datasets == dict() and properties.pool == dict()
+
+
+def test_stream(tools):
+    (tools / "zfs.out").write_text("tank\t1\ntank/a\t2\ntank/b\t3\n")
+    assert list(stream("tank", columns=("name", "used"))) == [
+        ["tank", "1"],
+        ["tank/a", "2"],
+        ["tank/b", "3"],
+    ]
+    rows = stream("tank", depth=1)
+    assert next(rows) == "tank"
+    rows.close()
+    assert (tools / "zfs.log").read_text().splitlines() == [
+        "list -H -o name,used -t filesystem,volume -r tank",
+        "list -H -o name -t filesystem,volume -d 1 tank",
+    ]
@@ -0,0 +1,96 @@
+import pytest
+
+import strapper.mounts as mounts
+
+from strapper.mounts import Mount, mount_all, mount_plan
+from strapper.plan import build_plan, read_resources
+
+
+@pytest.fixture
+def calls(monkeypatch, tmp_path):
+    monkeypatch.setenv("STRAPPER_SYSTEM_ROOT", str(tmp_path))
+    calls = []
+    monkeypatch.setattr(
+        mounts, "mount", lambda *args, **kwargs: calls.append(("mount", *args))
+    )
+    monkeypatch.setattr(
+        mounts, "umount", lambda *args, **kwargs: calls.append(("umount", *args))
+    )
+    return calls
+
+
+def layout(root):
+    return [
+        Mount("tank/system/root", f"{root}/mnt", "zfs"),
+        Mount("tank/system/nix", f"{root}/mnt/nix", "zfs"),
+        Mount("tank/system/persist", f"{root}/mnt/persist", "zfs"),
+        Mount("tank/system/tmp", f"{root}/tmp", "zfs", run=True),
+        Mount("tank/system/tmp/nix", f"{root}/tmp/nix", "zfs", run=True),
+    ]
+
+
+def test_everything_is_mounted_once(calls, tmp_path):
+    mount_all(layout(tmp_path), jobs=4, current=dict())
+    assert sorted(calls) == sorted(
+        ("mount", m.source, m.target) for m in layout(tmp_path)
+    )
+
+
+def test_mounting_again_mounts_nothing(calls, tmp_path):
+    current = {m.target: m.source for m in layout(tmp_path)}
+    mount_all(layout(tmp_path), jobs=4, current=current)
+    assert calls == []
+
+
+def test_only_the_children_left_are_mounted(calls, tmp_path):
+    [root, *children] = layout(tmp_path)
+    mount_all(layout(tmp_path), current={root.target: root.source})
+    assert sorted(calls) == sorted(("mount", m.source, m.target) for m in children)
+
+
+def test_the_live_system_is_mounted_over_and_never_unmounted(calls, tmp_path):
+    current = {f"{tmp_path}/tmp": "tmpfs", f"{tmp_path}/mnt/nix": "tank/old"}
+    mount_all(layout(tmp_path), current=current)
+    assert ("umount", f"{tmp_path}/mnt/nix") in calls
+    assert not ("umount", f"{tmp_path}/tmp") in calls
+    assert calls.count(("mount", "tank/system/tmp", f"{tmp_path}/tmp")) == 1
+
+
+def test_mounted_and_binds(tmp_path):
+    mountinfo = tmp_path / "mountinfo"
+    mountinfo.write_text(
+        "".join(
+            (
+                "1 0 0:1 / / rw - ext4 /dev/sda1 rw\n",
+                "2 1 0:2 / /mnt rw - zfs tank/system/root rw\n",
+                "3 2 0:2 / /mnt/mnt rw - zfs tank/system/root rw\n",
+                "4 2 0:3 / /mnt/home\\040dir rw - zfs tank/system/home rw\n",
+                "5 2 0:3 /alice /mnt/alice rw - zfs tank/system/home rw\n",
+            )
+        )
+    )
+    assert mounts.mounted(mountinfo) == {
+        "/": "/dev/sda1",
+        "/mnt": "tank/system/root",
+        "/mnt/mnt": "tank/system/root",
+        "/mnt/home dir": "tank/system/home",
+        "/mnt/alice": "tank/system/home",
+    }
+    assert mounts.binds(mountinfo) == {
+        "/mnt/mnt": "/mnt",
+        "/mnt/alice": "/mnt/home dir/alice",
+    }
+    assert mounts.mounted(tmp_path / "missing") == dict()
+
+
+def test_mount_plan(monkeypatch, tmp_path):
+    monkeypatch.setenv("STRAPPER_SYSTEM_ROOT", str(tmp_path))
+    plan = mount_plan(build_plan("tank", read_resources()), boot_device="/dev/sda1")
+    targets = {m.target: m for m in plan}
+    assert len(targets) == len(plan)
+    assert plan[0].target == f"{tmp_path}/mnt" and plan[-1].source == "/dev/sda1"
+    for m in plan:
+        assert m.run == m.target.startswith(f"{tmp_path}/tmp")
+        assert m.run or m.target.startswith(f"{tmp_path}/mnt")
+        if m.bind:
+            assert m.source in targets
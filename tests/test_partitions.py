@@ -0,0 +1,24 @@
+from strapper.partitions import layout, partlabel
+
+
+def test_partlabel():
+    assert partlabel("tank-boot-1") == "/dev/disk/by-partlabel/tank-boot-1"
+
+
+def test_layout_without_swap():
+    assert layout(["1GiB"], "tank") == [
+        ("mklabel", "gpt"),
+        ("mkpart", "primary", "0%", "1GiB"),
+        ("mkpart", "primary", "1GiB", "100%"),
+        ("name", 2, "tank"),
+    ]
+
+
+def test_layout_with_swap():
+    assert layout(["1GiB", "17GiB"], "tank-1") == [
+        ("mklabel", "gpt"),
+        ("mkpart", "primary", "0%", "1GiB"),
+        ("mkpart", "primary", "1GiB", "17GiB"),
+        ("mkpart", "primary", "17GiB", "100%"),
+        ("name", 3, "tank-1"),
+    ]
@@ -0,0 +1,79 @@
+import json
+
+from strapper.plan import build_plan, read_resources, reserved, templates
+
+
+def sources(datasets, users=("alice",), primary="alice"):
+    return {
+        "datasets.yaml": json.dumps(datasets).encode(),
+        "user_datasets.yaml": json.dumps(
+            {primary: dict(datasets=dict(docs=dict()), options=["mountpoint=legacy"])}
+        ).encode(),
+        "username.txt": primary.encode(),
+        "users.json": json.dumps({user: user for user in users}).encode(),
+        "homes.json": json.dumps({user: "/home/" + user for user in users}).encode(),
+    }
+
+
+small = dict(
+    system=dict(
+        datasets=dict(home=dict(), persist=dict(), root=dict(tags=["ephemeral"])),
+        options=["mountpoint=legacy"],
+    ),
+    virt=dict(datasets=dict(podman=dict()), options=["mountpoint=legacy"]),
+)
+
+
+def test_render_small():
+    plan = build_plan("tank", sources(small, users=("alice", "bob")))
+    assert plan.render() == "".join(
+        (
+            'host: { \n\t"${host}/system/root" = "/";\n',
+            '\t"${host}/system/home" = "/home";\n',
+            '\t"${host}/system/home/alice" = "/home/alice";\n',
+            '\t"${host}/system/home/bob" = "/home/bob";\n',
+            '\t"${host}/system/persist" = "/persist";\n',
+            '\t"${host}/system/persist/alice" = "/persist/alice";\n',
+            '\t"${host}/system/persist/bob" = "/persist/bob";\n',
+            '\t"${host}/virt" = "/virt";\n',
+            '\t"${host}/virt/podman" = "/virt/podman";\n',
+            '\t"${host}/virt/podman/alice" = "/virt/podman/alice";\n',
+            '\t"${host}/virt/podman/bob" = "/virt/podman/bob";\n',
+            '\t"${host}/alice" = "/alice";\n',
+            '\t"${host}/alice/docs" = [ "/home/alice/docs" "/home/bob/docs" ];\n',
+            '\t"${host}/tank" = "/tank";\n',
+            '\t"${host}/tank/jails" = "/tank/jails";\n',
+            '\t"${host}/tank/jails/base" = "/tank/jails/base";\n',
+            "}",
+        )
+    )
+    assert plan.render("/dev/sda2").startswith('host: { \n\t"/dev/sda2" = "/";\n')
+
+
+def test_users_clone_templates_and_inherit_tags():
+    plan = build_plan("tank", sources(small))
+    nodes = {node.name: node for node in plan}
+    assert nodes["tank/system/home/alice"].origin == "tank/templates/home@template"
+    assert nodes["tank/virt/podman/alice"].origin == "tank/templates/podman@template"
+    assert nodes["tank/system/root"].tags == ("ephemeral",)
+    assert nodes["tank/system/home"].tags == ()
+
+
+def test_packaged_resources():
+    plan = build_plan("tank", read_resources())
+    rendered = plan.render()
+    assert rendered == build_plan("tank", read_resources()).render()
+    assert rendered.startswith("host: {") and rendered.endswith("}")
+    names = [node.name for node in plan]
+    assert len(names) == len(set(names))
+    for [i, node] in enumerate(plan):
+        # Parents always come before their children.
+        assert node.parent < i
+        if node.parent >= 0:
+            assert node.name.startswith(plan[node.parent].name + "/")
+    assert "tank/" + reserved in plan.index
+    # The templates are only cloned from, never mounted.
+    assert not "/" + templates in rendered
+    for node in plan:
+        if node.name.startswith(f"tank/{templates}/"):
+            assert node.mountpoint is None
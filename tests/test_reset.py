@@ -0,0 +1,55 @@
+import strapper.reset as reset_module
+
+from strapper.plan import build_plan, read_resources
+from strapper.reset import reset, select, subtrees
+
+
+def plan():
+    return build_plan("tank", read_resources())
+
+
+def test_select():
+    names = [node.name for node in select(plan(), subtrees=("system/persist",))]
+    assert names[0] == "tank/system/persist"
+    assert all(name.startswith("tank/system/persist") for name in names)
+    everything = [node.name for node in select(plan(), everything=True)]
+    assert not any("/templates" in name or "/reserved" in name for name in everything)
+    excluded = select(plan(), everything=True, exclude=("system",))
+    assert not any(node.name.startswith("tank/system") for node in excluded)
+
+
+def test_subtrees_share_nothing():
+    nodes = select(plan(), subtrees=("system/home", "system/persist"))
+    current = {
+        "/mnt/home": "tank/system/home",
+        "/mnt/home/alice/docs": "tank/alice/docs",
+        "/mnt/persist": "tank/system/persist",
+    }
+    groups = subtrees(plan(), nodes, current)
+    assert [group[0][0] for group in groups] == [
+        "tank/system/home",
+        "tank/system/persist",
+    ]
+    assert groups[0][1] == {"/mnt/home", "/mnt/home/alice/docs"}
+    assert groups[1][1] == {"/mnt/persist"}
+
+
+def test_reset_remounts_binds_from_their_source(monkeypatch, programs):
+    calls = programs(reset_module, "zfs", "mount", "umount")
+    monkeypatch.setattr(reset_module, "print", lambda *args: None)
+    monkeypatch.setattr(reset_module, "stream", lambda host: ["tank/system/home"])
+    current = {
+        "/mnt/home": "tank/system/home",
+        "/mnt/home/bob/docs": "tank/alice/docs",
+    }
+    bound = {"/mnt/home/bob/docs": "/mnt/home/alice/docs"}
+    [node] = [node for node in plan() if node.name == "tank/system/home"]
+    timings = reset(plan(), [node], current=current, bound=bound)
+    assert list(timings) == ["tank/system/home"]
+    assert calls == [
+        ("umount", "/mnt/home/bob/docs"),
+        ("umount", "/mnt/home"),
+        ("zfs", "rollback", "tank/system/home@blank"),
+        ("mount", "tank/system/home", "/mnt/home"),
+        ("mount", "/mnt/home/alice/docs", "/mnt/home/bob/docs"),
+    ]
@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from strapper.scheduler import run_graph
+
+
+def test_dependencies_run_first():
+    order = []
+    lock = threading.Lock()
+
+    def task(item):
+        with lock:
+            order.append(item)
+        return item * 2
+
+    depends = [set(), {0}, {0}, {1, 2}]
+    results = run_graph([0, 1, 2, 3], depends, task, jobs=4)
+    assert results == {0: 0, 1: 2, 2: 4, 3: 6}
+    assert order[0] == 0 and order[-1] == 3
+
+
+def test_skipped_items_still_release_their_dependents():
+    results = run_graph([0, 1, 2], [set(), {0}, {1}], str, skip=lambda item: item == 1)
+    assert results == {0: "0", 2: "2"}
+
+
+def test_first_error_stops_everything_after_it():
+    ran = []
+
+    def task(item):
+        ran.append(item)
+        if item == "bad":
+            raise ValueError(item)
+
+    items = ["bad", "after", "later"]
+    with pytest.raises(ValueError, match="bad"):
+        run_graph(items, [set(), {0}, {1}], task, jobs=2)
+    assert ran == ["bad"]
+
+
+def test_nothing_new_starts_after_an_error():
+    ran = []
+
+    def task(item):
+        ran.append(item)
+        if item == 0:
+            raise RuntimeError(item)
+
+    # A single worker runs the independent items one at a time, in order.
+    with pytest.raises(RuntimeError):
+        run_graph([0, 1, 2], [set(), set(), set()], task, jobs=1)
+    assert ran == [0]
+
+
+def test_skipped_roots_release_their_dependents_once():
+    ran = []
+    results = run_graph(
+        [0, 1, 2, 3],
+        [set(), {0}, {1}, set()],
+        lambda item: ran.append(item) or item,
+        skip=lambda item: item == 0,
+    )
+    assert sorted(ran) == [1, 2, 3]
+    assert results == {1: 1, 2: 2, 3: 3}
@@ -0,0 +1,68 @@
+import tempfile
+import threading
+import time
+
+from pathlib import Path
+
+import pytest
+
+import strapper.session as session
+
+from strapper.inventory import Properties
+from strapper.plan import build_plan, read_resources
+from strapper.session import Client, serve
+
+
+@pytest.fixture
+def daemon(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+    monkeypatch.setattr(session, "imported", lambda pool: True)
+    loads = []
+
+    def load(pool):
+        loads.append(pool)
+        return Properties({pool: dict(compression="zstd")}, dict(size="1000"))
+
+    monkeypatch.setattr(session.Properties, "load", load)
+    # Socket paths are short, so this one can't be under `tmp_path'.
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory, "tank.sock")
+        thread = threading.Thread(target=serve, args=("tank", path))
+        thread.start()
+        while not (client := Client.connect("tank", path)):
+            time.sleep(0.01)
+        try:
+            yield client, loads
+        finally:
+            client.stop()
+            client.close()
+            thread.join()
+        assert not path.exists()
+
+
+def test_plan_and_properties(daemon):
+    [client, loads] = daemon
+    assert client.plan().render() == build_plan("tank", read_resources()).render()
+    assert client.properties().pool_bytes() == 1000
+    assert client.properties()["tank"] == dict(compression="zstd")
+    assert loads == ["tank"]
+    assert client.status()["imported"] is False
+
+
+def test_invalidate_reads_the_properties_again(daemon):
+    [client, loads] = daemon
+    client.properties()
+    client.invalidate()
+    client.properties()
+    assert loads == ["tank", "tank"]
+
+
+def test_errors_are_raised_in_the_client(daemon):
+    [client, _] = daemon
+    with pytest.raises(RuntimeError, match="isn't something a session can do"):
+        client.request("nothing")
+
+
+def test_no_daemon(tmp_path):
+    assert Client.connect("tank", tmp_path / "missing.sock") is None
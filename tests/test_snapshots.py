@@ -0,0 +1,28 @@
+from strapper.snapshots import chunk_arguments
+
+
+def test_everything_fits():
+    assert list(chunk_arguments(["a", "bb", "ccc"], limit=100)) == [["a", "bb", "ccc"]]
+
+
+def test_chunks_count_the_terminating_nul():
+    # Each argument costs its length and one more byte.
+    assert list(chunk_arguments(["aaa", "bbb", "ccc"], limit=8)) == [
+        ["aaa", "bbb"],
+        ["ccc"],
+    ]
+    assert list(chunk_arguments(["aaa", "bbb", "ccc"], limit=7)) == [
+        ["aaa"],
+        ["bbb"],
+        ["ccc"],
+    ]
+
+
+def test_arguments_are_counted_in_bytes():
+    assert list(chunk_arguments(["é", "é"], limit=5)) == [["é"], ["é"]]
+    assert list(chunk_arguments(["é", "é"], limit=6)) == [["é", "é"]]
+
+
+def test_an_argument_longer_than_the_limit_gets_a_chunk_of_its_own():
+    assert list(chunk_arguments(["a" * 10, "b"], limit=4)) == [["a" * 10], ["b"]]
+    assert list(chunk_arguments([], limit=4)) == []
@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from strapper.stages import (
+    Stage,
+    critical_path,
+    dependencies,
+    load_timings,
+    render,
+    run_stages,
+    save_timings,
+)
+
+
+def nothing():
+    pass
+
+
+stages = [
+    Stage("partitioning", nothing, outputs=("devices",)),
+    Stage("datasets.nix", nothing, outputs=("datasets.nix",)),
+    Stage("pool creation", nothing, inputs=("devices",), outputs=("pool",)),
+    Stage("dataset tree", nothing, inputs=("pool", "datasets.nix", "left out")),
+]
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    return tmp_path
+
+
+def test_dependencies():
+    assert dependencies(stages) == [set(), set(), {0}, {1, 2}]
+
+
+def test_critical_path():
+    assert critical_path(stages, dict()) == (
+        0.0,
+        ["partitioning", "pool creation", "dataset tree"],
+    )
+    assert critical_path(stages, {"datasets.nix": 5.0, "pool creation": 1.0}) == (
+        5.0,
+        ["datasets.nix", "dataset tree"],
+    )
+    assert "Critical path: partitioning -> pool creation" in render(stages, dict())
+
+
+def test_timings_are_remembered_per_command():
+    save_timings("create", {"partitioning": 1.0})
+    save_timings("create", {"dataset tree": 2.0})
+    save_timings("mount", {"mount": 3.0})
+    assert load_timings("create") == {"partitioning": 1.0, "dataset tree": 2.0}
+    assert load_timings("update") == dict()
+
+
+def test_run_stages():
+    ran = []
+    lock = threading.Lock()
+
+    def stage(name, inputs=(), outputs=()):
+        def run():
+            with lock:
+                ran.append(name)
+
+        return Stage(name, run, inputs, outputs)
+
+    timings = run_stages(
+        "create", [stage("second", inputs=("a",)), stage("first", outputs=("a",))]
+    )
+    assert ran == ["first", "second"]
+    assert load_timings("create") == timings
+
+
+def test_a_failed_stage_stops_the_rest():
+    stopped = []
+
+    def fail():
+        raise RuntimeError("failed")
+
+    with pytest.raises(RuntimeError):
+        run_stages(
+            "create",
+            [Stage("fails", fail, outputs=("a",)), Stage("after", nothing, ("a",))],
+            sequential=True,
+            on_error=lambda: stopped.append(True),
+        )
+    assert stopped == [True]
+    assert load_timings("create") == dict()
@@ -0,0 +1,33 @@
+import subprocess
+import sys
+
+import pytest
+
+from bench.startup import budget, help_time
+
+# Both need the command line itself, and so its dependencies.
+pytest.importorskip("oreo")
+
+
+def test_commands_import_their_features_lazily():
+    modules = subprocess.run(
+        (
+            sys.executable,
+            "-c",
+            "import sys, strapper.strapper; print(*sorted(sys.modules))",
+        ),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    assert [m for m in modules if m.startswith("strapper.")] == [
+        "strapper.lazy",
+        "strapper.strapper",
+        "strapper.trace",
+    ]
+    for module in ("importlib.resources", "socket", "subprocess"):
+        assert not module in modules
+
+
+def test_help_is_within_its_budget():
+    assert help_time() <= budget
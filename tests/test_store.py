@@ -0,0 +1,63 @@
+import os
+
+import strapper.store as store
+
+from strapper.store import Report, copy_path, flake_argument, nar_sizes
+
+
+class Process:
+    def __init__(self, stdout, returncode=0):
+        self.stdout = stdout
+        self.returncode = returncode
+
+
+def test_flake_argument():
+    assert flake_argument(["--no-root-passwd", "--flake", ".#host"]) == ".#host"
+    assert flake_argument(["--flake=.#host"]) == ".#host"
+    assert flake_argument(["--flake"]) is None
+    assert flake_argument([]) is None
+
+
+def test_nar_sizes_reads_either_format(monkeypatch):
+    outputs = iter(
+        (
+            Process('[{"path": "/nix/store/a", "narSize": 1}]'),
+            Process('{"/nix/store/b": {"narSize": 2}, "/nix/store/c": null}'),
+            Process("not json"),
+        )
+    )
+    monkeypatch.setattr(store, "run_query", lambda argv: next(outputs))
+    assert nar_sizes(["/nix/store/a"]) == {"/nix/store/a": 1}
+    assert nar_sizes(["/nix/store/b", "/nix/store/c"]) == {"/nix/store/b": 2}
+    assert nar_sizes(["/nix/store/d"]) == dict()
+
+
+def test_copy_path(tmp_path):
+    source = tmp_path / "store" / "abc-hello"
+    (source / "bin").mkdir(parents=True)
+    (source / "bin" / "hello").write_text("#!/bin/sh\n")
+    os.chmod(source / "bin" / "hello", 0o555)
+    (source / "lib").symlink_to("bin")
+    os.chmod(source / "bin", 0o555)
+    os.chmod(source, 0o555)
+    root = tmp_path / "root"
+    (root / str(tmp_path / "store").lstrip("/")).mkdir(parents=True)
+    try:
+        assert copy_path(str(source), str(root)) == len("#!/bin/sh\n")
+        target = root / str(source).lstrip("/")
+        assert (target / "bin" / "hello").read_text() == "#!/bin/sh\n"
+        assert os.readlink(target / "lib") == "bin"
+        assert os.stat(target).st_mode & 0o777 == 0o555
+        assert os.listdir(target.parent) == [target.name]
+    finally:
+        for path in (source, source / "bin", target, target / "bin"):
+            os.chmod(path, 0o755)
+
+
+def test_report():
+    assert str(Report()).startswith("Couldn't evaluate the system")
+    report = Report("/nix/store/system.drv")
+    [report.paths, report.bytes, report.present, report.kept] = [2, 100, 3, 50]
+    assert "found 3 already there." in str(report)
+    report.total = 200
+    assert str(report).endswith("150 were reused and 50 fetched or built.")
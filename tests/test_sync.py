@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+from strapper.sync import sync_tree
+
+
+@pytest.fixture
+def trees(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "directory").mkdir()
+    (source / "directory" / "file").write_text("content")
+    (source / "script").write_text("#!/bin/sh\n")
+    os.chmod(source / "script", 0o644)
+    (source / "link").symlink_to("script")
+    return source, tmp_path / "destination", tmp_path / "cache"
+
+
+def sync(trees, **kwargs):
+    [source, destination, cache] = trees
+    return sync_tree(source, destination, cache_dir=cache, **kwargs)
+
+
+def test_copies_and_then_leaves_everything_alone(trees):
+    [source, destination, _] = trees
+    report = sync(trees)
+    assert report.files == 3
+    assert (destination / "directory" / "file").read_text() == "content"
+    assert os.readlink(destination / "link") == "script"
+    report = sync(trees)
+    assert (report.files, report.attributes, report.unchanged) == (0, 0, 3)
+
+
+def test_mode_changes(trees):
+    [source, destination, _] = trees
+    sync(trees)
+    os.chmod(source / "script", 0o755)
+    report = sync(trees)
+    assert (report.files, report.attributes) == (0, 1)
+    assert os.stat(destination / "script").st_mode & 0o777 == 0o755
+
+
+def test_mtime_changes(trees):
+    [source, destination, _] = trees
+    sync(trees)
+    os.utime(source / "script", ns=(0, 10**18))
+    report = sync(trees)
+    assert (report.files, report.attributes) == (0, 1)
+    assert os.stat(destination / "script").st_mtime_ns == 10**18
+
+
+def test_directory_times_are_kept(trees):
+    [source, destination, _] = trees
+    os.utime(source / "directory", ns=(0, 10**18))
+    sync(trees)
+    assert os.stat(destination / "directory").st_mtime_ns == 10**18
+
+
+def test_a_directory_becomes_a_file(trees):
+    [source, destination, _] = trees
+    sync(trees)
+    (source / "directory" / "file").unlink()
+    (source / "directory").rmdir()
+    (source / "directory").write_text("now a file")
+    sync(trees)
+    assert (destination / "directory").read_text() == "now a file"
+
+
+def test_a_file_becomes_a_directory(trees):
+    [source, destination, _] = trees
+    sync(trees)
+    (source / "script").unlink()
+    (source / "script").mkdir()
+    (source / "script" / "inside").write_text("inside")
+    sync(trees)
+    assert (destination / "script" / "inside").read_text() == "inside"
+    assert (destination / "link" / "inside").read_text() == "inside"
+
+
+def test_a_symlink_becomes_a_directory_and_back(trees):
+    [source, destination, _] = trees
+    sync(trees)
+    (source / "link").unlink()
+    (source / "link").mkdir()
+    sync(trees)
+    assert (destination / "link").is_dir() and not (destination / "link").is_symlink()
+    (source / "link").rmdir()
+    (source / "link").symlink_to("directory")
+    sync(trees)
+    assert os.readlink(destination / "link") == "directory"
+
+
+def test_delete(trees):
+    [source, destination, _] = trees
+    sync(trees)
+    (destination / "directory" / "kept").write_text("not ours")
+    (source / "link").unlink()
+    (source / "directory" / "file").unlink()
+    (source / "directory").rmdir()
+    assert sync(trees).deleted == 0
+    assert (destination / "link").is_symlink()
+    report = sync(trees, delete=True)
+    # The directory still holds a file something else put there.
+    assert report.deleted == 2
+    assert not os.path.lexists(destination / "link")
+    assert sorted(os.listdir(destination / "directory")) == ["kept"]
@@ -0,0 +1,44 @@
+import pytest
+
+import strapper.wipe as wipe
+
+from strapper.wipe import discards, partitions, wipe_devices
+
+
+@pytest.fixture
+def sysfs(tmp_path):
+    # `sda' has two partitions and discards; `sdb' has neither.
+    for path in ("sda/sda1", "sda/sda2"):
+        (tmp_path / path).mkdir(parents=True)
+        (tmp_path / path / "partition").write_text("1")
+    (tmp_path / "sda" / "queue").mkdir()
+    (tmp_path / "sda" / "queue" / "discard_max_bytes").write_text("2147450880")
+    (tmp_path / "sdb" / "queue").mkdir(parents=True)
+    (tmp_path / "sdb" / "queue" / "discard_max_bytes").write_text("0")
+    return tmp_path
+
+
+@pytest.fixture
+def calls(monkeypatch, programs):
+    monkeypatch.setattr(wipe, "print", lambda *args: None)
+    return programs(wipe, "blkdiscard", "fallocate", "wipefs", "zpool")
+
+
+def test_partitions_and_discards(sysfs):
+    assert partitions("/dev/sda", sysfs) == ["/dev/sda1", "/dev/sda2"]
+    assert partitions("/dev/sdb", sysfs) == []
+    assert partitions("/dev/sdc", sysfs) == []
+    assert discards("/dev/sda", sysfs)
+    assert not discards("/dev/sdb", sysfs)
+    assert not discards("/dev/sdc", sysfs)
+
+
+def test_a_regular_file_is_punched_through(calls, tmp_path):
+    (image := tmp_path / "disk.img").write_bytes(b"\1" * 4096)
+    seconds = wipe_devices([image, image], jobs=2, sysfs=tmp_path)
+    assert list(seconds) == [image]
+    assert calls == [
+        ("zpool", "labelclear", str(image)),
+        ("wipefs", str(image)),
+        ("fallocate", str(image)),
+    ]